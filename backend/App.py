@@ -1,15 +1,36 @@
 """
 Flask API Server for Humming-Based Song Detection
 Provides REST endpoints for song database management and humming matching
+
+Production: gunicorn -c gunicorn_conf.py "App:create_app()"
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response
 from flask_cors import CORS
+import hashlib
+import io
+import multiprocessing
 import os
+
+# Let numpy's BLAS/OpenMP backends use every core (must precede the numpy import)
+os.environ.setdefault('OMP_NUM_THREADS', str(os.cpu_count()))
+os.environ.setdefault('MKL_NUM_THREADS', str(os.cpu_count()))
+
+import re
+import sqlite3
+import threading
 import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from pathlib import Path
-from werkzeug.utils import secure_filename
 import json
+import orjson
+import scipy.fft
+
+try:
+    import blake3
+except ImportError:  # Fall back to hashlib's BLAKE2
+    blake3 = None
 
 from melody_matcher import (
     MelodyDatabase,
@@ -17,6 +38,7 @@ from melody_matcher import (
     PitchExtractor,
     ContourExtractor
 )
+from upload_io import save_upload, write_buffer
 
 
 # Initialize Flask app
@@ -27,47 +49,178 @@ CORS(app)  # Enable CORS for React frontend
 UPLOAD_FOLDER = Path('uploads')
 DATABASE_FOLDER = Path('database')
 ALLOWED_EXTENSIONS = {'wav', 'mp3', 'ogg', 'flac', 'm4a', 'mp4'}
+# Formats librosa can decode from memory (others are decoded from the saved file)
+IN_MEMORY_EXTENSIONS = {'wav', 'mp3', 'ogg', 'flac'}
+_ALLOWED_EXT_RE = re.compile(
+    r'\.(?:' + '|'.join(sorted(ALLOWED_EXTENSIONS)) + r')\Z', re.IGNORECASE
+)
 
 UPLOAD_FOLDER.mkdir(exist_ok=True)
 DATABASE_FOLDER.mkdir(exist_ok=True)
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+
+# Per-request upload paths are plain string joins against this prefix
+UPLOAD_STR = str(UPLOAD_FOLDER) + os.sep
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 
+# Matching runs here; the DTW kernel releases the GIL, so matches use all cores
+match_executor = ThreadPoolExecutor(max_workers=os.cpu_count())
+
 # Initialize melody database and matcher
 melody_db = MelodyDatabase()
 matcher = HummingMatcher(melody_db)
 
-# Metadata storage (in production, use a real database)
-METADATA_FILE = DATABASE_FOLDER / 'metadata.json'
+# Signatures of the database folder in one memory-mapped file, refreshed at startup
+SIGNATURE_PACK = DATABASE_FOLDER / 'signatures.pack'
+
+# Metadata storage (SQLite in WAL mode; song_metadata is an in-memory cache)
+METADATA_FILE = DATABASE_FOLDER / 'metadata.json'  # Legacy store, migrated once
+METADATA_DB = DATABASE_FOLDER / 'metadata.db'
+METADATA_COLUMNS = ('title', 'artist', 'filename', 'original_filename')
 song_metadata = {}
 
+def _connect_metadata_db():
+    """Open the metadata database and create the schema if needed"""
+    conn = sqlite3.connect(str(METADATA_DB), check_same_thread=False)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute(
+        'CREATE TABLE IF NOT EXISTS songs ('
+        'id TEXT PRIMARY KEY, title TEXT, artist TEXT, filename TEXT, original_filename TEXT)'
+    )
+    conn.commit()
+    return conn
+
+# Opened on first use by the process that uses it: SQLite connections must
+# not cross a fork (e.g. from a preloading server master into its workers)
+_metadata_conn = None
+_metadata_conn_pid = None
+metadata_lock = threading.Lock()
+
+def metadata_conn():
+    """This process's metadata database connection (call with metadata_lock held)"""
+    global _metadata_conn, _metadata_conn_pid
+    if _metadata_conn is None or _metadata_conn_pid != os.getpid():
+        _metadata_conn = _connect_metadata_db()
+        _metadata_conn_pid = os.getpid()
+    return _metadata_conn
+
 def load_metadata():
-    """Load song metadata from file"""
+    """Load song metadata from the database (importing metadata.json on first run)"""
     global song_metadata
-    if METADATA_FILE.exists():
+    try:
+        with metadata_lock:
+            rows = metadata_conn().execute(
+                f"SELECT id, {', '.join(METADATA_COLUMNS)} FROM songs"
+            ).fetchall()
+        song_metadata = {
+            row[0]: {col: value for col, value in zip(METADATA_COLUMNS, row[1:]) if value is not None}
+            for row in rows
+        }
+    except Exception as e:
+        print(f"⚠️ Failed to load metadata: {e}")
+        song_metadata = {}
+        return
+    
+    if song_metadata:
+        print(f"✅ Loaded metadata for {len(song_metadata)} songs")
+    elif METADATA_FILE.exists():
         try:
-            with open(METADATA_FILE, 'r', encoding='utf-8') as f:
-                song_metadata = json.load(f)
-                print(f"✅ Loaded metadata for {len(song_metadata)} songs")
+            with open(METADATA_FILE, 'rb') as f:
+                legacy_metadata = orjson.loads(f.read())
+            save_song_metadata(legacy_metadata)
+            print(f"✅ Migrated metadata for {len(legacy_metadata)} songs from {METADATA_FILE.name}")
         except Exception as e:
-            print(f"⚠️ Failed to load metadata: {e}")
-            song_metadata = {}
+            print(f"⚠️ Failed to migrate metadata: {e}")
     else:
-        print("ℹ️ No metadata file found, starting fresh")
-        song_metadata = {}
-
-def save_metadata():
-    """Save song metadata to file"""
+        print("ℹ️ No metadata found, starting fresh")
+
+def save_song_metadata(entries):
+    """Insert or update metadata for each song in entries ({song_id: metadata})"""
+    rows = [
+        (song_id, *(meta.get(col) for col in METADATA_COLUMNS))
+        for song_id, meta in entries.items()
+    ]
     try:
-        with open(METADATA_FILE, 'w', encoding='utf-8') as f:
-            json.dump(song_metadata, f, indent=2, ensure_ascii=False)
+        with metadata_lock:
+            conn = metadata_conn()
+            with conn:
+                conn.executemany(
+                    f"INSERT OR REPLACE INTO songs (id, {', '.join(METADATA_COLUMNS)}) VALUES (?, ?, ?, ?, ?)",
+                    rows
+                )
     except Exception as e:
         print(f"⚠️ Failed to save metadata: {e}")
+    song_metadata.update(entries)
+
+def delete_song_metadata(song_id):
+    """Remove a song's metadata and return it"""
+    try:
+        with metadata_lock:
+            conn = metadata_conn()
+            with conn:
+                conn.execute('DELETE FROM songs WHERE id = ?', (song_id,))
+    except Exception as e:
+        print(f"⚠️ Failed to delete metadata: {e}")
+    return song_metadata.pop(song_id, {})
+
+# Serialized /api/songs payload, rebuilt after any catalog change
+_songs_list_cache = None
+_songs_cache_version = 0
+
+def invalidate_songs_cache():
+    """Mark the cached song list as stale"""
+    global _songs_cache_version
+    _songs_cache_version += 1
+
+# Recent /api/match results keyed by upload content hash (least recent first),
+# dropped whenever the melody database changes
+MATCH_CACHE_SIZE = 128
+_match_cache = OrderedDict()
+_match_cache_version = None
+_match_cache_lock = threading.Lock()
+
+def audio_digest(data):
+    """Content hash of an uploaded clip"""
+    if blake3 is not None:
+        return blake3.blake3(data).hexdigest()
+    return hashlib.blake2b(data, digest_size=32).hexdigest()
+
+def get_cached_match(key):
+    """Look up cached match results, or None on a miss"""
+    global _match_cache_version
+    with _match_cache_lock:
+        if _match_cache_version != melody_db.version:
+            _match_cache.clear()
+            _match_cache_version = melody_db.version
+            return None
+        results = _match_cache.get(key)
+        if results is not None:
+            _match_cache.move_to_end(key)
+        return results
+
+def cache_match(key, results, version):
+    """Store match results computed against melody database `version`"""
+    with _match_cache_lock:
+        if version != melody_db.version or version != _match_cache_version:
+            return
+        _match_cache[key] = results
+        _match_cache.move_to_end(key)
+        if len(_match_cache) > MATCH_CACHE_SIZE:
+            _match_cache.popitem(last=False)
+
+def _compute_signature(song_id, file_path):
+    """Extract a song signature (runs in a worker process)"""
+    return MelodyDatabase().add_song(song_id, file_path)
+
+# Characters kept in stored upload names; everything else (including path
+# separators) becomes '_'
+_SANITIZE = re.compile(r'[^A-Za-z0-9._-]')
 
 def allowed_file(filename):
     """Check if file extension is allowed"""
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+    return _ALLOWED_EXT_RE.search(filename) is not None
 
 
 # ============ API ENDPOINTS ============
@@ -84,20 +237,26 @@ def health_check():
 @app.route('/api/songs', methods=['GET'])
 def list_songs():
     """List all songs in the database"""
-    songs = []
-    for song_id in melody_db.list_songs():
-        metadata = song_metadata.get(song_id, {})
-        signature = melody_db.get_signature(song_id)
+    global _songs_list_cache
+    version = _songs_cache_version
+    
+    if _songs_list_cache is None or _songs_list_cache[0] != version:
+        songs = []
+        for song_id in melody_db.list_songs():
+            metadata = song_metadata.get(song_id, {})
+            signature = melody_db.get_signature(song_id)
+            
+            songs.append({
+                'id': song_id,
+                'title': metadata.get('title', 'Unknown'),
+                'artist': metadata.get('artist', 'Unknown'),
+                'contour_length': len(signature.pitch_contour) if signature else 0,
+                'duration': signature.duration if signature else 0
+            })
         
-        songs.append({
-            'id': song_id,
-            'title': metadata.get('title', 'Unknown'),
-            'artist': metadata.get('artist', 'Unknown'),
-            'contour_length': len(signature.pitch_contour) if signature else 0,
-            'duration': signature.duration if signature else 0
-        })
+        _songs_list_cache = (version, json.dumps({'songs': songs}).encode('utf-8'))
     
-    return jsonify({'songs': songs})
+    return Response(_songs_list_cache[1], mimetype='application/json')
 
 
 @app.route('/api/songs', methods=['POST'])
@@ -131,22 +290,24 @@ def add_song():
     song_id = str(uuid.uuid4())
     
     # Save file
-    filename = secure_filename(f"{song_id}_{file.filename}")
-    filepath = UPLOAD_FOLDER / filename
-    file.save(filepath)
+    filename = _SANITIZE.sub('_', f"{song_id}_{file.filename}")
+    filepath = UPLOAD_STR + filename
+    save_upload(file, filepath)
     
     try:
         # Add to database
-        signature = melody_db.add_song(song_id, str(filepath), duration)
+        signature = melody_db.add_song(song_id, filepath, duration)
         
         # Save metadata
-        song_metadata[song_id] = {
-            'title': title,
-            'artist': artist,
-            'filename': filename,
-            'original_filename': file.filename
-        }
-        save_metadata()
+        save_song_metadata({
+            song_id: {
+                'title': title,
+                'artist': artist,
+                'filename': filename,
+                'original_filename': file.filename
+            }
+        })
+        invalidate_songs_cache()
         
         return jsonify({
             'success': True,
@@ -158,8 +319,8 @@ def add_song():
     
     except Exception as e:
         # Clean up on error
-        if filepath.exists():
-            filepath.unlink()
+        if os.path.exists(filepath):
+            os.unlink(filepath)
         return jsonify({'error': str(e)}), 500
 
 
@@ -170,17 +331,17 @@ def delete_song(song_id):
         return jsonify({'error': 'Song not found'}), 404
     
     # Remove from database
-    del melody_db.signatures[song_id]
+    melody_db.remove_song(song_id)
     
     # Remove metadata
-    metadata = song_metadata.pop(song_id, {})
-    save_metadata()
+    metadata = delete_song_metadata(song_id)
+    invalidate_songs_cache()
     
     # Remove file
     if 'filename' in metadata:
-        filepath = UPLOAD_FOLDER / metadata['filename']
-        if filepath.exists():
-            filepath.unlink()
+        filepath = UPLOAD_STR + metadata['filename']
+        if os.path.exists(filepath):
+            os.unlink(filepath)
     
     return jsonify({'success': True})
 
@@ -208,22 +369,37 @@ def match_humming():
     # Get parameters
     top_k = int(request.form.get('top_k', 5))
     
-    # Save temporary file
+    # Uploads are decoded from memory; the file is only written to disk for
+    # debugging (?debug=1) or for formats that must be decoded from a path
     temp_id = str(uuid.uuid4())
-    filename = secure_filename(f"hum_{temp_id}_{file.filename}")
-    filepath = UPLOAD_FOLDER / filename
-    file.save(filepath)
+    filename = _SANITIZE.sub('_', f"hum_{temp_id}_{file.filename}")
+    filepath = UPLOAD_STR + filename
+    extension = file.filename.rsplit('.', 1)[1].lower()
+    debug = request.args.get('debug') == '1'
+    in_memory = extension in IN_MEMORY_EXTENSIONS
+    
+    # Read straight from the request (MAX_CONTENT_LENGTH bounds the size)
+    audio = file.stream.read()
+    key = audio_digest(audio)
+    if debug or not in_memory:
+        write_buffer(filepath, audio)
     
     try:
         # Perform matching
-        results = matcher.match_with_details(str(filepath))
+        # Replayed clips skip extraction and DTW entirely
+        results = get_cached_match(key)
+        if results is None:
+            version = melody_db.version
+            source = io.BytesIO(audio) if in_memory else filepath
+            results = match_executor.submit(matcher.match_with_details, source).result()
+            cache_match(key, results, version)
         
         # Enrich with metadata
         enriched_matches = []
         for match in results['matches']:
             song_id = match['song_id']
             metadata = song_metadata.get(song_id, {})
-            
+        
             enriched_matches.append({
                 'song_id': song_id,
                 'title': metadata.get('title', 'Unknown'),
@@ -233,18 +409,17 @@ def match_humming():
                 'confidence': 'high' if match['similarity_score'] > 0.7 else 
                              'medium' if match['similarity_score'] > 0.5 else 'low'
             })
-        
-        results['matches'] = enriched_matches[:top_k]
-        
-        return jsonify(results)
+    
+        # Build a new response so the cached results stay untouched
+        return jsonify({**results, 'matches': enriched_matches[:top_k]})
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
     
     finally:
-        # Clean up temporary file
-        if filepath.exists():
-            filepath.unlink()
+        # Clean up temporary file (kept for inspection in debug mode)
+        if not debug and os.path.exists(filepath):
+            os.unlink(filepath)
 
 
 @app.route('/api/analyze', methods=['POST'])
@@ -263,47 +438,51 @@ def analyze_audio():
     
     # Save temporary file
     temp_id = str(uuid.uuid4())
-    filename = secure_filename(f"analyze_{temp_id}_{file.filename}")
-    filepath = UPLOAD_FOLDER / filename
-    file.save(filepath)
+    filename = _SANITIZE.sub('_', f"analyze_{temp_id}_{file.filename}")
+    filepath = UPLOAD_STR + filename
+    save_upload(file, filepath)
     
     try:
         # Extract pitch and contour
         pitch_extractor = PitchExtractor()
         contour_extractor = ContourExtractor()
         
-        pitch = pitch_extractor.extract_pitch(str(filepath))
+        # librosa's FFTs go through scipy.fft; let them use every core
+        with scipy.fft.set_workers(-1):
+            pitch = pitch_extractor.extract_pitch(filepath)
         contour = contour_extractor.extract_contour(pitch)
         
-        # Convert to lists for JSON serialization
+        # orjson serializes the arrays directly (unvoiced NaN frames become null)
         import numpy as np
-        pitch_clean = pitch[~np.isnan(pitch)]
+        valid = int(np.count_nonzero(~np.isnan(pitch)))
         
-        return jsonify({
+        payload = {
             'pitch': {
                 'length': len(pitch),
-                'valid_frames': len(pitch_clean),
-                'min': float(pitch_clean.min()) if len(pitch_clean) > 0 else None,
-                'max': float(pitch_clean.max()) if len(pitch_clean) > 0 else None,
-                'mean': float(pitch_clean.mean()) if len(pitch_clean) > 0 else None,
-                'values': pitch.tolist()
+                'valid_frames': valid,
+                'min': float(np.nanmin(pitch)) if valid > 0 else None,
+                'max': float(np.nanmax(pitch)) if valid > 0 else None,
+                'mean': float(np.nanmean(pitch)) if valid > 0 else None,
+                'values': np.ascontiguousarray(pitch)
             },
             'contour': {
                 'length': len(contour),
                 'ups': int((contour == 1).sum()),
                 'downs': int((contour == -1).sum()),
                 'stable': int((contour == 0).sum()),
-                'values': contour.tolist()
+                'values': np.ascontiguousarray(contour)
             }
-        })
-    
+        }
+        return Response(orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY),
+                        mimetype='application/json')
+        
     except Exception as e:
         return jsonify({'error': str(e)}), 500
     
     finally:
         # Clean up
-        if filepath.exists():
-            filepath.unlink()
+        if os.path.exists(filepath):
+            os.unlink(filepath)
 
 
 @app.route('/api/batch-add', methods=['POST'])
@@ -317,6 +496,7 @@ def batch_add_songs():
     
     songs_data = request.json['songs_data']
     results = []
+    new_metadata = {}
     
     for song_info in songs_data:
         try:
@@ -332,7 +512,7 @@ def batch_add_songs():
             signature = melody_db.add_song(song_id, filepath, duration)
             
             # Save metadata
-            song_metadata[song_id] = {
+            new_metadata[song_id] = {
                 'title': title,
                 'artist': artist,
                 'filename': Path(filepath).name,
@@ -352,7 +532,8 @@ def batch_add_songs():
                 'filepath': song_info.get('filepath', 'unknown')
             })
     
-    save_metadata()
+    save_song_metadata(new_metadata)
+    invalidate_songs_cache()
     
     return jsonify({
         'total': len(songs_data),
@@ -375,9 +556,8 @@ def internal_error(error):
 
 
 # ============ STARTUP ============
-if __name__ == '__main__':
-    print("\n🎵 HumFinder - Humming Detection Server\n")
-    
+def initialize_database():
+    """Load metadata and signatures for every audio file in the database folder"""
     # Step 1: Load existing metadata
     load_metadata()
     
@@ -393,7 +573,16 @@ if __name__ == '__main__':
     audio_files = [f for f in all_files if f.suffix.lower().lstrip('.') in ALLOWED_EXTENSIONS]
     print(f"   Audio files (.wav, .mp3, etc.): {len(audio_files)}\n")
     
+    # Signatures saved by the last startup come back with a single mmap
+    if SIGNATURE_PACK.exists():
+        melody_db.load(SIGNATURE_PACK)
+    packed_ids = set(melody_db.list_songs())
+    packed_version = melody_db.version
+    
     loaded_count = 0
+    pending = []
+    new_metadata = {}
+    present_ids = set()
     
     for file_path in audio_files:
         # Check if file already exists in metadata
@@ -405,29 +594,61 @@ if __name__ == '__main__':
         
         # Use existing ID if found, otherwise generate new UUID
         song_id = existing_id or str(uuid.uuid4())
+        present_ids.add(song_id)
+        
+        if song_id in packed_ids:
+            continue
         
         signature_path = DATABASE_FOLDER / f"{song_id}.sig"
 
         if signature_path.exists():
             melody_db.load_signature(song_id, signature_path)
         else:
-            signature = melody_db.add_song(song_id, str(file_path))
-            signature.save(signature_path)
-            # Only add to metadata if it's a new file
-            if not existing_id:
-                song_metadata[song_id] = {
-                    'title': file_path.stem,
-                    'artist': 'Unknown',
-                    'filename': file_path.name
-                }
-            
-            print(f"✅ Added ({len(signature.pitch_contour)} contour points)")
-            loaded_count += 1
+            pending.append((song_id, file_path, existing_id))
+    
+    # Drop packed songs whose audio file is gone
+    for song_id in packed_ids - present_ids:
+        melody_db.remove_song(song_id)
+    
+    # Extract new signatures in parallel (CPU-bound pitch tracking)
+    if pending:
+        # spawn: forked workers would inherit Numba's threads and the server could not exit
+        with ProcessPoolExecutor(max_workers=os.cpu_count(),
+                                 mp_context=multiprocessing.get_context('spawn')) as executor:
+            futures = {
+                executor.submit(_compute_signature, song_id, str(file_path)): (song_id, file_path, existing_id)
+                for song_id, file_path, existing_id in pending
+            }
+            for future in as_completed(futures):
+                song_id, file_path, existing_id = futures[future]
+                try:
+                    signature = future.result()
+                except Exception as e:
+                    print(f"⚠️ Failed: {file_path.name} -> {e}")
+                    continue
+                
+                melody_db.register(song_id, signature)
+                signature.save(DATABASE_FOLDER / f"{song_id}.sig")
+                # Only add to metadata if it's a new file
+                if not existing_id:
+                    new_metadata[song_id] = {
+                        'title': file_path.stem,
+                        'artist': 'Unknown',
+                        'filename': file_path.name
+                    }
                 
+                print(f"✅ Added {file_path.name} ({len(signature.pitch_contour)} contour points)")
+                loaded_count += 1
+                
+    
+    # Pack all contours for matching (and for the next startup if anything changed)
+    if melody_db.version != packed_version:
+        melody_db.save(SIGNATURE_PACK)
+    melody_db.packed()
     
     # Step 3: Save updated metadata if new songs were added
     if loaded_count > 0:
-        save_metadata()
+        save_song_metadata(new_metadata)
         print(f"\n💾 Metadata saved with {loaded_count} new songs!")
     else:
         print(f"\n⚠️  No new songs added")
@@ -437,9 +658,26 @@ if __name__ == '__main__':
     print(f"   • Total songs in database: {len(melody_db.list_songs())}")
     print(f"   • Newly loaded: {loaded_count}")
     print(f"   • Metadata entries: {len(song_metadata)}")
+
+
+def create_app():
+    """
+    WSGI entry point for production servers
+    
+    Usage: gunicorn -c gunicorn_conf.py "App:create_app()"
+    """
+    initialize_database()
+    return app
+
+
+if __name__ == '__main__':
+    print("\n🎵 HumFinder - Humming Detection Server\n")
+    
+    initialize_database()
     
     print(f"\n🚀 Starting server on http://localhost:5000\n")
     
-    # app.run(debug=True, host='0.0.0.0', port=5000)
-    app.run(debug=True, use_reloader=False)
+    # Development server only; see create_app() for production
+    from werkzeug.serving import run_simple
+    run_simple('localhost', 5000, app, use_debugger=True, threaded=True)
 
@@ -3,10 +3,12 @@ from flask_cors import CORS
 import os
 import uuid
 import json
-import subprocess
-import shutil
+import multiprocessing
+import queue
 from pathlib import Path
-from werkzeug.utils import secure_filename
+
+import match as match_module
+from upload_io import save_upload
 
 # Initialize Flask app
 app = Flask(__name__)
@@ -20,6 +22,10 @@ ALLOWED_EXTENSIONS = {'json'}
 UPLOAD_FOLDER.mkdir(exist_ok=True)
 OUTPUT_FOLDER.mkdir(exist_ok=True)
 
+# Per-request paths are plain string joins against these prefixes
+UPLOAD_STR = str(UPLOAD_FOLDER) + os.sep
+OUTPUT_STR = str(OUTPUT_FOLDER) + os.sep
+
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['OUTPUT_FOLDER'] = OUTPUT_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024  # 50MB max file size
@@ -27,9 +33,64 @@ app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024  # 50MB max file size
 # Store analysis sessions
 analysis_sessions = {}
 
+# Match analysis runs in long-lived child processes, one per slot, so a
+# timed-out analysis can be killed without paying interpreter startup and the
+# match/numba imports on every request; at most ANALYSIS_SLOTS run at once and
+# further requests are turned away instead of queueing
+ANALYSIS_TIMEOUT = 300  # 5 minute timeout (running time only)
+ANALYSIS_SLOTS = 4
+# Spawned, not forked: the server process is multithreaded
+analysis_context = multiprocessing.get_context('spawn')
+# Idle single-process pools, most recently used on top so warm children are
+# reused first; None marks a slot whose pool starts on first use
+analysis_pools = queue.LifoQueue()
+for _ in range(ANALYSIS_SLOTS):
+    analysis_pools.put(None)
+
+
+class AnalysisBusyError(RuntimeError):
+    """Every analysis slot is taken"""
+
+
+def run_match_analysis(match1_path, match2_path, lookahead_frames, min_passes, output_file):
+    """
+    Run match analysis in a child process and save the result to output_file
+    
+    Raises:
+        AnalysisBusyError: If ANALYSIS_SLOTS analyses are already running
+        multiprocessing.TimeoutError: If the analysis ran longer than
+            ANALYSIS_TIMEOUT (the child is terminated)
+    """
+    try:
+        pool = analysis_pools.get_nowait()
+    except queue.Empty:
+        raise AnalysisBusyError('Too many analyses in progress, try again later') from None
+    try:
+        if pool is None:
+            pool = analysis_context.Pool(processes=1)
+        result = pool.apply_async(
+            match_module.run_analysis,
+            (match1_path, match2_path, lookahead_frames, min_passes)
+        )
+        try:
+            analysis_data = result.get(timeout=ANALYSIS_TIMEOUT)
+        except multiprocessing.TimeoutError:
+            # Kill the stuck child; the slot starts a fresh pool next time
+            pool.terminate()
+            pool.join()
+            pool = None
+            raise
+    finally:
+        analysis_pools.put(pool)
+    
+    with open(output_file, 'w') as f:
+        json.dump(analysis_data, f, indent=2)
+    
+    return analysis_data
+
 def allowed_file(filename):
-    """Check if file extension is allowed"""
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+    """Check if file extension is allowed (.json only)"""
+    return filename.lower().endswith('.json')
 
 
 # ============ API ENDPOINTS ============
@@ -75,14 +136,15 @@ def upload_matches():
     session_id = str(uuid.uuid4())
     
     # Save files
-    match1_filename = secure_filename(f"{session_id}_match1.json")
-    match2_filename = secure_filename(f"{session_id}_match2.json")
+    # Names are built from the UUID only, so no sanitizing is needed
+    match1_filename = f"{session_id}_match1.json"
+    match2_filename = f"{session_id}_match2.json"
     
-    match1_path = UPLOAD_FOLDER / match1_filename
-    match2_path = UPLOAD_FOLDER / match2_filename
+    match1_path = UPLOAD_STR + match1_filename
+    match2_path = UPLOAD_STR + match2_filename
     
-    match1_file.save(match1_path)
-    match2_file.save(match2_path)
+    save_upload(match1_file, match1_path)
+    save_upload(match2_file, match2_path)
     
     # Store session info
     analysis_sessions[session_id] = {
@@ -132,14 +194,15 @@ def analyze_direct():
     session_id = str(uuid.uuid4())
     
     # Save files
-    match1_filename = secure_filename(f"{session_id}_match1.json")
-    match2_filename = secure_filename(f"{session_id}_match2.json")
+    # Names are built from the UUID only, so no sanitizing is needed
+    match1_filename = f"{session_id}_match1.json"
+    match2_filename = f"{session_id}_match2.json"
     
-    match1_path = UPLOAD_FOLDER / match1_filename
-    match2_path = UPLOAD_FOLDER / match2_filename
+    match1_path = UPLOAD_STR + match1_filename
+    match2_path = UPLOAD_STR + match2_filename
     
-    match1_file.save(match1_path)
-    match2_file.save(match2_path)
+    save_upload(match1_file, match1_path)
+    save_upload(match2_file, match2_path)
     
     # Store session info
     analysis_sessions[session_id] = {
@@ -151,50 +214,12 @@ def analyze_direct():
     }
     
     try:
-        # Run integrated analysis script
-        default_output = Path('integrated_analysis_output.json')
-        
-        cmd = [
-            'python',
-            'match.py',
-            str(match1_path),
-            str(match2_path),
-            '--lookahead', str(lookahead_frames),
-            '--minpasses', str(min_passes)
-        ]
-        
-        # Execute analysis
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            timeout=300,  # 5 minute timeout
-            cwd=str(Path.cwd())
+        # Run integrated analysis
+        output_file = f"{OUTPUT_STR}{session_id}_analysis.json"
+        analysis_data = run_match_analysis(
+            match1_path, match2_path, lookahead_frames, min_passes, output_file
         )
         
-        print(f"\n[Analysis {session_id}] Script return code: {result.returncode}")
-        if result.stdout:
-            print(f"[Analysis {session_id}] STDOUT:\n{result.stdout}")
-        if result.stderr:
-            print(f"[Analysis {session_id}] STDERR:\n{result.stderr}")
-        
-        if result.returncode != 0:
-            analysis_sessions[session_id]['status'] = 'error'
-            analysis_sessions[session_id]['error'] = result.stderr
-            return jsonify({'error': 'Analysis failed', 'details': result.stderr}), 500
-        
-        # Load analysis results from default output file
-        if not default_output.exists():
-            analysis_sessions[session_id]['status'] = 'error'
-            return jsonify({'error': 'Output file not generated'}), 500
-        
-        with open(default_output, 'r') as f:
-            analysis_data = json.load(f)
-        
-        # Copy to session-specific location
-        output_file = OUTPUT_FOLDER / f"{session_id}_analysis.json"
-        shutil.copy(default_output, output_file)
-        
         # Update session
         analysis_sessions[session_id]['status'] = 'completed'
         analysis_sessions[session_id]['output_file'] = f"{session_id}_analysis.json"
@@ -212,7 +237,12 @@ def analyze_direct():
         
         return jsonify(response_data)
     
-    except subprocess.TimeoutExpired:
+    except AnalysisBusyError as e:
+        analysis_sessions[session_id]['status'] = 'error'
+        analysis_sessions[session_id]['error'] = str(e)
+        return jsonify({'error': str(e)}), 503
+    
+    except multiprocessing.TimeoutError:
         analysis_sessions[session_id]['status'] = 'error'
         analysis_sessions[session_id]['error'] = 'Analysis timeout'
         return jsonify({'error': 'Analysis timeout'}), 504
@@ -241,42 +271,15 @@ def analyze_matches(session_id):
     
     try:
         # Get file paths
-        match1_path = UPLOAD_FOLDER / session['match1_file']
-        match2_path = UPLOAD_FOLDER / session['match2_file']
+        match1_path = UPLOAD_STR + session['match1_file']
+        match2_path = UPLOAD_STR + session['match2_file']
         
-        # Run integrated analysis script
-        output_file = OUTPUT_FOLDER / f"{session_id}_analysis.json"
-        
-        cmd = [
-            'python3',
-            'match.py',
-            str(match1_path),
-            str(match2_path),
-            '--lookahead', str(session['lookahead_frames']),
-            '--minpasses', str(session['min_passes']),
-            '--output', str(output_file)
-        ]
-        
-        # Execute analysis
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            timeout=300  # 5 minute timeout
+        # Run integrated analysis
+        output_file = f"{OUTPUT_STR}{session_id}_analysis.json"
+        analysis_data = run_match_analysis(
+            match1_path, match2_path, session['lookahead_frames'], session['min_passes'], output_file
         )
         
-        if result.returncode != 0:
-            session['status'] = 'error'
-            session['error'] = result.stderr
-            return jsonify({
-                'error': 'Analysis failed',
-                'details': result.stderr
-            }), 500
-        
-        # Load analysis results
-        with open(output_file, 'r') as f:
-            analysis_data = json.load(f)
-        
         # Update session
         session['status'] = 'completed'
         session['output_file'] = f"{session_id}_analysis.json"
@@ -288,7 +291,12 @@ def analyze_matches(session_id):
             'data': analysis_data
         })
     
-    except subprocess.TimeoutExpired:
+    except AnalysisBusyError as e:
+        session['status'] = 'error'
+        session['error'] = str(e)
+        return jsonify({'error': str(e)}), 503
+    
+    except multiprocessing.TimeoutError:
         session['status'] = 'error'
         session['error'] = 'Analysis timeout'
         return jsonify({'error': 'Analysis timeout'}), 504
@@ -334,9 +342,9 @@ def download_results(session_id):
     if session['status'] != 'completed':
         return jsonify({'error': 'Analysis not completed'}), 400
     
-    output_file = OUTPUT_FOLDER / session['output_file']
+    output_file = OUTPUT_STR + session['output_file']
     
-    if not output_file.exists():
+    if not os.path.exists(output_file):
         return jsonify({'error': 'Output file not found'}), 404
     
     return send_file(
@@ -371,15 +379,15 @@ def delete_session(session_id):
     
     # Delete uploaded files
     for filename in [session['match1_file'], session['match2_file']]:
-        filepath = UPLOAD_FOLDER / filename
-        if filepath.exists():
-            filepath.unlink()
+        filepath = UPLOAD_STR + filename
+        if os.path.exists(filepath):
+            os.unlink(filepath)
     
     # Delete output file
     if 'output_file' in session:
-        output_file = OUTPUT_FOLDER / session['output_file']
-        if output_file.exists():
-            output_file.unlink()
+        output_file = OUTPUT_STR + session['output_file']
+        if os.path.exists(output_file):
+            os.unlink(output_file)
     
     # Remove session
     del analysis_sessions[session_id]
@@ -406,4 +414,6 @@ if __name__ == '__main__':
     print(f"📂 Output folder: {OUTPUT_FOLDER.resolve()}")
     print(f"\n🚀 Starting server on http://localhost:5000\n")
     
-    app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
+    # Development server only; production: gunicorn -c gunicorn_conf.py Appfb:app
+    from werkzeug.serving import run_simple
+    run_simple('0.0.0.0', 5000, app, use_debugger=True, use_reloader=True, threaded=True)
\ No newline at end of file
@@ -0,0 +1,30 @@
+"""
+Ahead-of-time build of the play DTW kernels in match.py
+
+    python _dtw_ext.py
+
+compiles the same kernel source into the _dtw extension module next to this
+file. match.py imports it when present, so runs skip Numba's JIT warmup;
+rebuild it after changing the kernels. pycc has no parallel target, so the
+AOT pair grid runs on a single core; delete the built module to go back to
+the parallel JIT kernels
+"""
+
+import os
+
+from numba.pycc import CC
+
+import match
+
+cc = CC('_dtw')
+cc.output_dir = os.path.dirname(os.path.abspath(__file__))
+
+cc.export('dtw_norm', 'f8(f4[:, ::1], f4[:, ::1], i8)')(match._dtw_norm_jit.py_func)
+cc.export(
+    'pair_dtw',
+    'void(f4[:, ::1], i8[::1], f4[:, ::1], i8[::1], b1[:, ::1], i8, f8[:, ::1])'
+)(match._pair_dtw_jit.py_func)
+
+
+if __name__ == '__main__':
+    cc.compile()
@@ -0,0 +1,25 @@
+"""
+Gunicorn configuration for the Flask API servers
+
+Usage:
+    gunicorn -c gunicorn_conf.py "App:create_app()"
+    gunicorn -c gunicorn_conf.py Appfb:app
+"""
+
+import multiprocessing
+
+bind = '0.0.0.0:5000'
+
+# One process: the song database, metadata cache and match cache (and
+# Appfb's analysis sessions) live in memory, so every request has to see the
+# same copy. Threads let uploads and long analyses overlap; the heavy work
+# runs outside the GIL (DTW kernels) or in child processes (match analysis)
+workers = 1
+worker_class = 'gthread'
+threads = 2 * multiprocessing.cpu_count() + 1
+
+# Must exceed the 300s analysis timeout
+timeout = 360
+
+# The app is loaded in the worker itself (no preload_app): nothing opened at
+# import time (database connections, buffers) is shared across a fork
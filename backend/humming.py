@@ -7,8 +7,94 @@ while removing lyrics and timbre variations.
 
 import numpy as np
 import librosa
+import scipy.signal
 import soundfile as sf
 import sys
+from numba import njit, prange
+
+
+@njit(parallel=True, fastmath=True, cache=True)
+def _yin_kernel(frames, acf, win, tau_min, tau_max, threshold):
+    """
+    Cumulative-mean-normalized difference, absolute threshold and parabolic
+    interpolation for every frame (frames are processed in parallel)
+    
+    Returns:
+        Period estimate in samples per frame, NaN where no dip was found
+    """
+    n_frames = frames.shape[0]
+    periods = np.full(n_frames, np.nan)
+    
+    for t in prange(n_frames):
+        x = frames[t]
+        cmnd = np.empty(tau_max + 1)
+        cmnd[0] = 1.0
+        
+        # Energy of the reference window and of the lagged window
+        energy0 = 0.0
+        for j in range(win):
+            energy0 += x[j] * x[j]
+        energy = energy0
+        running_sum = 0.0
+        
+        for tau in range(1, tau_max + 1):
+            energy += x[tau + win - 1] * x[tau + win - 1] - x[tau - 1] * x[tau - 1]
+            diff = energy0 + energy - 2.0 * acf[t, tau]
+            running_sum += diff
+            cmnd[tau] = diff * tau / running_sum if running_sum > 0 else 1.0
+        
+        # First dip below threshold, followed down to its local minimum
+        best = -1
+        tau = tau_min
+        while tau <= tau_max:
+            if cmnd[tau] < threshold:
+                while tau < tau_max and cmnd[tau + 1] < cmnd[tau]:
+                    tau += 1
+                best = tau
+                break
+            tau += 1
+        
+        if best < 0:
+            continue
+        
+        # Parabolic interpolation around the dip
+        shift = 0.0
+        if 0 < best < tau_max:
+            a, b, c = cmnd[best - 1], cmnd[best], cmnd[best + 1]
+            denom = a - 2.0 * b + c
+            if abs(denom) > 1e-12:
+                shift = 0.5 * (a - c) / denom
+        periods[t] = best + shift
+    
+    return periods
+
+
+def yin_frames(y, frame_length, hop, tau_min, tau_max, threshold=0.1):
+    """
+    Frame-wise YIN period estimation
+    
+    Args:
+        y: Audio signal
+        frame_length: Analysis frame size (samples)
+        hop: Number of samples between frames
+        tau_min: Smallest period to consider (samples)
+        tau_max: Largest period to consider (samples)
+        threshold: Absolute threshold on the normalized difference
+        
+    Returns:
+        Period (samples) for each frame, NaN for unvoiced frames
+    """
+    # Centered frames, one per hop (same framing as librosa)
+    y = np.pad(y, frame_length // 2)
+    frames = np.lib.stride_tricks.sliding_window_view(y, frame_length)[::hop]
+    
+    # Autocorrelation of every frame against its first window, in one FFT batch
+    win = frame_length - tau_max
+    n_fft = 1 << int(np.ceil(np.log2(frame_length + win)))
+    spectrum = np.fft.rfft(frames, n_fft) * np.conj(np.fft.rfft(frames[:, :win], n_fft))
+    acf = np.ascontiguousarray(np.fft.irfft(spectrum, n_fft)[:, :tau_max + 1])
+    
+    return _yin_kernel(np.ascontiguousarray(frames), acf, win, tau_min, tau_max, threshold)
 
 
 def vocal_to_humming(input_file, output_file, sample_rate=22050):
@@ -24,14 +110,19 @@ def vocal_to_humming(input_file, output_file, sample_rate=22050):
     print(f"Loading {input_file}...")
     y, sr = librosa.load(input_file, sr=sample_rate, mono=True)
     
-    # Extract pitch using pYIN
+    # Extract pitch using YIN
     print("Extracting pitch...")
-    f0, voiced_flag, voiced_probs = librosa.pyin(
+    hop_length = 512
+    fmin = librosa.note_to_hz('C2')  # 65 Hz
+    fmax = librosa.note_to_hz('C7')  # 2093 Hz
+    periods = yin_frames(
         y,
-        fmin=librosa.note_to_hz('C2'),  # 65 Hz
-        fmax=librosa.note_to_hz('C7'),  # 2093 Hz
-        sr=sr
+        frame_length=2048,
+        hop=hop_length,
+        tau_min=int(np.floor(sr / fmax)),
+        tau_max=int(np.ceil(sr / fmin))
     )
+    f0 = sr / periods
     
     # Clean pitch: interpolate unvoiced regions
     print("Cleaning pitch...")
@@ -49,29 +140,23 @@ def vocal_to_humming(input_file, output_file, sample_rate=22050):
     
     # Generate humming-like audio using sine wave synthesis
     print("Synthesizing humming audio...")
-    hop_length = 512
-    humming = np.zeros(len(y))
-    
-    for i, freq in enumerate(f0_clean):
-        if not np.isnan(freq):
-            # Time range for this frame
-            start = i * hop_length
-            end = min(start + hop_length, len(humming))
-            t = np.arange(end - start) / sr
-            
-            # Generate sine wave at extracted pitch
-            humming[start:end] = np.sin(2 * np.pi * freq * t)
+    # Hold each frame's pitch for hop_length samples and integrate the
+    # instantaneous frequency, so the phase stays continuous across frames
+    freqs_per_sample = np.repeat(f0_clean, hop_length)[:len(y)]
+    if len(freqs_per_sample) < len(y):
+        freqs_per_sample = np.pad(freqs_per_sample, (0, len(y) - len(freqs_per_sample)),
+                                  constant_values=np.nan)
+    voiced = ~np.isnan(freqs_per_sample)
+    phase = 2 * np.pi * np.cumsum(np.where(voiced, freqs_per_sample, 0.0)) / sr
+    humming = np.sin(phase) * voiced
     
     # Apply amplitude envelope from original audio
     print("Applying envelope...")
     # Get RMS energy envelope
     rms = librosa.feature.rms(y=y, hop_length=hop_length)[0]
-    # Upsample envelope to match audio length
-    envelope = np.interp(
-        np.arange(len(humming)),
-        np.linspace(0, len(humming), len(rms)),
-        rms
-    )
+    # Upsample envelope to match audio length (polyphase FIR, no stairstepping)
+    envelope = scipy.signal.resample_poly(rms, hop_length, 1)[:len(humming)]
+    envelope = np.maximum(envelope, 0.0)  # Remove filter ringing below zero
     
     # Apply envelope to humming
     humming = humming * envelope * 10  # Scale up amplitude
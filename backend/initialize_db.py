@@ -1,36 +1,59 @@
-import json
+import multiprocessing
+import os
+import orjson
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from melody_matcher import MelodyDatabase
 
 # مسار فولدر الأغاني
 DATABASE_FOLDER = Path(r'C:\Users\LENOVO\OneDrive\المستندات\DSP\similarityDetection-\backend\database')
 
-# إنشاء قاعدة بيانات
-melody_db = MelodyDatabase()
-song_metadata = {}
 
-# قراءة كل الملفات الصوتية في الفولدر
-for file_path in DATABASE_FOLDER.iterdir():
-    if file_path.suffix.lower() in ['.wav', '.mp3', '.flac', '.ogg', '.m4a']:
-        song_id = file_path.stem  # اسم الملف بدون امتداد
-        try:
+def fingerprint_one(file_path: Path):
+    """Extract one song's signature (runs in a worker process)"""
+    song_id = file_path.stem  # اسم الملف بدون امتداد
+    signature = MelodyDatabase().add_song(song_id, str(file_path))
+    metadata = {
+        'title': song_id,
+        'artist': 'Unknown',
+        'filename': file_path.name
+    }
+    return song_id, metadata, signature
+
+
+if __name__ == '__main__':
+    # إنشاء قاعدة بيانات
+    melody_db = MelodyDatabase()
+    song_metadata = {}
+
+    # قراءة كل الملفات الصوتية في الفولدر
+    audio_paths = [
+        file_path for file_path in DATABASE_FOLDER.iterdir()
+        if file_path.suffix.lower() in ['.wav', '.mp3', '.flac', '.ogg', '.m4a']
+    ]
+
+    # استخراج البصمات بالتوازي، والتسجيل في العملية الرئيسية فقط
+    # spawn: a forked worker would inherit melody_matcher's Numba threads and hang the exit
+    with ProcessPoolExecutor(max_workers=os.cpu_count(),
+                             mp_context=multiprocessing.get_context('spawn')) as executor:
+        futures = [(executor.submit(fingerprint_one, file_path), file_path) for file_path in audio_paths]
+        for future, file_path in futures:
+            try:
+                song_id, metadata, signature = future.result()
+            except Exception as e:
+                print(f'Failed: {file_path.name} -> {e}')
+                continue
+
             # إضافة الأغنية لـ MelodyDatabase
-            signature = melody_db.add_song(song_id, str(file_path))
-            
+            melody_db.register(song_id, signature)
+
             # حفظ البيانات الوصفية
-            song_metadata[song_id] = {
-                'title': song_id,
-                'artist': 'Unknown',
-                'filename': file_path.name
-            }
+            song_metadata[song_id] = metadata
             print(f'Added: {song_id}')
-        except Exception as e:
-            print(f'Failed: {file_path.name} -> {e}')
-
-# حفظ metadata.json
-metadata_file = DATABASE_FOLDER / 'metadata.json'
-with open(metadata_file, 'w', encoding='utf-8') as f:
-    json.dump(song_metadata, f, indent=2, ensure_ascii=False)
 
-print(f'Total songs added: {len(song_metadata)}')
+    # حفظ metadata.json
+    metadata_file = DATABASE_FOLDER / 'metadata.json'
+    with open(metadata_file, 'wb') as f:
+        f.write(orjson.dumps(song_metadata, option=orjson.OPT_INDENT_2))
 
+    print(f'Total songs added: {len(song_metadata)}')
@@ -4,9 +4,12 @@ Integrated Football Match Analysis
 Combines ball tracking with play identification and similarity analysis
 """
 
-import json
+import heapq
 import math
 import numpy as np
+import orjson
+from functools import lru_cache
+from numba import njit, prange
 from typing import List, Dict, Tuple, Optional
 
 
@@ -34,61 +37,59 @@ def get_ball_position(frame: Dict, last_known_pos: Optional[Tuple[float, float]]
     return (None, False)
 
 
-def get_all_players(frame: Dict) -> List[Dict]:
-    """Get all visible players from both teams"""
-    players = []
+def get_all_players(frame: Dict) -> Tuple[List[int], List[str], np.ndarray]:
+    """
+    Get all visible players from both teams
     
-    # Add home players
-    for player in frame.get('homePlayers', []):
-        if player.get('visibility') != 'INVISIBLE':
-            players.append({
-                'id': player.get('playerId'),
-                'x': player.get('x'),
-                'y': player.get('y'),
-                'team': 'home'
-            })
+    Returns:
+        (ids, teams, xy) where xy is an (N, 2) array of positions
+        (missing coordinates are NaN)
+    """
+    ids = []
+    teams = []
+    coords = []
     
-    # Add away players
-    for player in frame.get('awayPlayers', []):
-        if player.get('visibility') != 'INVISIBLE':
-            players.append({
-                'id': player.get('playerId'),
-                'x': player.get('x'),
-                'y': player.get('y'),
-                'team': 'away'
-            })
+    for team, key in (('home', 'homePlayers'), ('away', 'awayPlayers')):
+        for player in frame.get(key, []):
+            if player.get('visibility') != 'INVISIBLE':
+                ids.append(player.get('playerId'))
+                teams.append(team)
+                coords.append((player.get('x'), player.get('y')))
     
-    return players
+    xy = np.array(coords, dtype=np.float64).reshape(-1, 2)
+    return ids, teams, xy
 
 
-def find_closest_player(ball_pos: Tuple[float, float], players: List[Dict]) -> Optional[Dict]:
+def find_closest_player(ball_pos: Tuple[float, float],
+                        players: Tuple[List[int], List[str], np.ndarray]) -> Optional[Dict]:
     """Find player closest to ball position"""
-    if not players or ball_pos is None:
+    ids, teams, xy = players
+    if not ids or ball_pos is None:
         return None
     
     ball_x, ball_y = ball_pos
-    closest_player = None
-    min_distance = float('inf')
     
-    for player in players:
-        px = player.get('x')
-        py = player.get('y')
-        
-        if px is None or py is None:
-            continue
-        
-        # Calculate Euclidean distance
-        distance = math.sqrt((px - ball_x)**2 + (py - ball_y)**2)
-        
-        if distance < min_distance:
-            min_distance = distance
-            closest_player = {
-                'player_id': player['id'],
-                'team': player['team'],
-                'distance': distance
-            }
+    # Squared Euclidean distances; players without coordinates never win
+    d2 = (xy[:, 0] - ball_x)**2 + (xy[:, 1] - ball_y)**2
+    d2[np.isnan(d2)] = np.inf
     
-    return closest_player
+    k = int(np.argmin(d2))
+    if d2[k] == np.inf:
+        return None
+    
+    return {
+        'player_id': ids[k],
+        'team': teams[k],
+        'distance': float(np.sqrt(d2[k]))
+    }
+
+
+def get_attacking_direction(frames: List[Dict]) -> str:
+    """Attacking direction ('R' or 'L') from stadium metadata, default 'R'"""
+    if frames and len(frames) > 0:
+        stadium_meta = frames[0].get('stadiumMetadata', {})
+        return stadium_meta.get('teamAttackingDirection', 'R')
+    return 'R'
 
 
 def normalize_coordinates(x: float, y: float, team: str, attacking_direction: str, 
@@ -125,11 +126,12 @@ def get_pitch_zone(x: float, pitch_length: float = 105.0) -> str:
     Returns:
         Zone name
     """
-    third = pitch_length / 3.0
+    third = pitch_length / 3
+    two_thirds = 2 * pitch_length / 3
     
     if x < third:
         return 'defensive'
-    elif x < 2 * third:
+    elif x < two_thirds:
         return 'middle'
     else:
         return 'attacking'
@@ -139,28 +141,73 @@ def get_pitch_zone(x: float, pitch_length: float = 105.0) -> str:
 # PLAY ANALYSIS FUNCTIONS
 # ============================================================================
 
-def get_team_from_player(frames: List[Dict], player_id: int) -> str:
+class FrameIndex:
+    """
+    Lookup tables over a match's frames, built once per analysis
+    
+    - start_times: startTime of every frame, for vectorized frame search
+    - players(i): playerId -> (x, y, team) for frame i, built lazily
+    - player_team: playerId -> team of the player's first appearance
+    """
+    
+    def __init__(self, frames: List[Dict]):
+        self.frames = frames
+        self.start_times = np.fromiter((f.get('startTime', 0) for f in frames),
+                                       dtype=np.float64, count=len(frames))
+        self._sorted = bool(np.all(np.diff(self.start_times) >= 0))
+        self._by_id: List[Optional[Dict]] = [None] * len(frames)
+        self._player_team: Optional[Dict[int, str]] = None
+    
+    def find_frame(self, frame_time: float, tolerance: float) -> Optional[int]:
+        """Index of the first frame whose startTime is within tolerance of frame_time"""
+        if self._sorted:
+            idx = int(np.searchsorted(self.start_times, frame_time - tolerance, side='right'))
+            if idx < len(self.start_times) and abs(self.start_times[idx] - frame_time) < tolerance:
+                return idx
+            return None
+        
+        matches = np.flatnonzero(np.abs(self.start_times - frame_time) < tolerance)
+        return int(matches[0]) if len(matches) else None
+    
+    def players(self, idx: int) -> Dict[int, Tuple[float, float, str]]:
+        """Players of frame idx by id (home listed first wins on duplicates)"""
+        by_id = self._by_id[idx]
+        if by_id is None:
+            frame = self.frames[idx]
+            by_id = {}
+            for team, key in (('home', 'homePlayers'), ('away', 'awayPlayers')):
+                for player in frame.get(key, []):
+                    by_id.setdefault(player.get('playerId'), (player.get('x', 0), player.get('y', 0), team))
+            self._by_id[idx] = by_id
+        return by_id
+    
+    @property
+    def player_team(self) -> Dict[int, str]:
+        if self._player_team is None:
+            player_team = {}
+            for frame in self.frames:
+                for team, key in (('home', 'homePlayers'), ('away', 'awayPlayers')):
+                    for player in frame.get(key, []):
+                        player_team.setdefault(player.get('playerId'), team)
+            self._player_team = player_team
+        return self._player_team
+
+
+def get_team_from_player(frames: List[Dict], player_id: int, index: Optional[FrameIndex] = None) -> str:
     """Find which team a player belongs to"""
-    for frame in frames:
-        # Check home team
-        for player in frame.get('homePlayers', []):
-            if player.get('playerId') == player_id:
-                return 'home'
-        # Check away team
-        for player in frame.get('awayPlayers', []):
-            if player.get('playerId') == player_id:
-                return 'away'
-    return None
-
-
-def get_player_position(frames: List[Dict], player_id: int, frame_time: float, lookahead_frames: int = 3) -> Tuple[float, float]:
+    if index is None:
+        index = FrameIndex(frames)
+    return index.player_team.get(player_id)
+
+
+def get_player_position(frames: List[Dict], player_id: int, frame_time: float, lookahead_frames: int = 3,
+                        index: Optional[FrameIndex] = None) -> Tuple[float, float]:
     """Get player position at specific frame time with lookahead support"""
+    if index is None:
+        index = FrameIndex(frames)
+    
     # Find starting frame index
-    frame_idx = None
-    for i, frame in enumerate(frames):
-        if abs(frame.get('startTime', 0) - frame_time) < 0.5:
-            frame_idx = i
-            break
+    frame_idx = index.find_frame(frame_time, 0.5)
     
     if frame_idx is None:
         return (0, 0)
@@ -170,92 +217,81 @@ def get_player_position(frames: List[Dict], player_id: int, frame_time: float, l
         if frame_idx + offset >= len(frames):
             break
         
-        frame = frames[frame_idx + offset]
-        
-        # Check home players
-        for player in frame.get('homePlayers', []):
-            if player.get('playerId') == player_id:
-                return (player.get('x', 0), player.get('y', 0))
-        
-        # Check away players
-        for player in frame.get('awayPlayers', []):
-            if player.get('playerId') == player_id:
-                return (player.get('x', 0), player.get('y', 0))
+        entry = index.players(frame_idx + offset).get(player_id)
+        if entry is not None:
+            return (entry[0], entry[1])
     
     return (0, 0)
 
 
 def find_closest_teammate(frames: List[Dict], target_player_id: int, team: str, 
                           frame_time: float, max_radius: float = 5.0, 
-                          lookahead_frames: int = 3) -> Tuple[int, float, float]:
+                          lookahead_frames: int = 3,
+                          index: Optional[FrameIndex] = None) -> Tuple[int, float, float]:
     """
     Find closest player from same team if target player not found
     Improved to handle frame shifts between event and tracking data
     """
+    if index is None:
+        index = FrameIndex(frames)
+    
     # Get target player position (with lookahead)
-    target_pos = get_player_position(frames, target_player_id, frame_time, lookahead_frames)
+    target_pos = get_player_position(frames, target_player_id, frame_time, lookahead_frames, index)
     
     # If target found, return it
     if target_pos != (0, 0):
         return (target_player_id, target_pos[0], target_pos[1])
     
     # Find frame index with wider tolerance for frame shifts
-    frame_idx = None
-    for i, frame in enumerate(frames):
-        if abs(frame.get('startTime', 0) - frame_time) < 1.0:  # Increased tolerance to 1 second
-            frame_idx = i
-            break
+    frame_idx = index.find_frame(frame_time, 1.0)  # Increased tolerance to 1 second
     
     if frame_idx is None:
         return (None, 0, 0)
     
-    # Search in wider window (before and after)
-    closest_player = None
-    closest_dist = float('inf')
-    closest_pos = (0, 0)
-    
-    # Get ball position as reference, searching wider range
+    # Search in wider window (2 frames before, at least 5 after) in a single
+    # pass: the first non-zero ball position is the reference, and every
+    # same-team player seen in the window is a candidate
+    search_range = max(lookahead_frames, 5)
+    team_key = 'homePlayers' if team == 'home' else 'awayPlayers'
     ball_pos = None
-    search_range = max(lookahead_frames, 5)  # Search at least 5 frames
+    ball_found = False
+    candidates = []
     
-    for offset in range(-2, search_range + 1):  # Also check 2 frames before
-        idx = frame_idx + offset
-        if idx < 0 or idx >= len(frames):
-            continue
-        
+    for idx in range(max(0, frame_idx - 2), min(len(frames), frame_idx + search_range + 1)):
         frame = frames[idx]
-        ball_data = frame.get('ball', [])
-        if ball_data and ball_data[0] is not None:
-            ball_pos = (ball_data[0].get('x', 0), ball_data[0].get('y', 0))
-            if ball_pos != (0, 0):
-                break
-    
-    if ball_pos is None:
-        return (None, 0, 0)
-    
-    # Find closest player from same team in wider range
-    for offset in range(-2, search_range + 1):
-        idx = frame_idx + offset
-        if idx < 0 or idx >= len(frames):
-            continue
         
-        frame = frames[idx]
-        players = frame.get('homePlayers', []) if team == 'home' else frame.get('awayPlayers', [])
+        if not ball_found:
+            ball_data = frame.get('ball', [])
+            if ball_data and ball_data[0] is not None:
+                ball_pos = (ball_data[0].get('x', 0), ball_data[0].get('y', 0))
+                ball_found = ball_pos != (0, 0)
         
-        for player in players:
-            player_id = player.get('playerId')
+        for player in frame.get(team_key, []):
             px, py = player.get('x', 0), player.get('y', 0)
-            
             if px == 0 and py == 0:
                 continue
-            
-            # Calculate distance to ball
-            dist = math.sqrt((px - ball_pos[0])**2 + (py - ball_pos[1])**2)
-            
-            if dist < closest_dist and dist <= max_radius:
-                closest_dist = dist
-                closest_player = player_id
-                closest_pos = (px, py)
+            candidates.append((player.get('playerId'), px, py))
+    
+    if ball_pos is None or not candidates:
+        return (None, 0, 0)
+    
+    # Closest candidate within max_radius (squared distances; sqrt is
+    # monotonic so the winner is the same)
+    closest_player = None
+    closest_dist_sq = float('inf')
+    closest_pos = (0, 0)
+    max_radius_sq = max_radius * max_radius
+    bx, by = ball_pos
+    
+    for player_id, px, py in candidates:
+        dx = px - bx
+        dy = py - by
+        dist_sq = dx*dx + dy*dy
+        
+        if dist_sq < closest_dist_sq and dist_sq <= max_radius_sq:
+            closest_dist_sq = dist_sq
+            closest_player = player_id
+            closest_pos = (px, py)
     
     if closest_player:
         return (closest_player, closest_pos[0], closest_pos[1])
@@ -268,18 +304,14 @@ def identify_plays(frames: List[Dict], lookahead_frames: int = 3, max_radius: fl
     """
     Identify plays as sequences of successful same-team passes
     Only returns plays with minimum number of passes
-    Normalizes coordinates for consistent attacking direction
+    Pass coordinates are stored raw; plays_to_matrix normalizes them to a
+    left-to-right attack when building features
     """
     plays = []
     current_play = []
     current_team = None
-    
-    # Get attacking direction from stadium metadata (if available)
-    attacking_direction = 'R'  # Default: attack right
-    if frames and len(frames) > 0:
-        stadium_meta = frames[0].get('stadiumMetadata', {})
-        team_direction = stadium_meta.get('teamAttackingDirection', 'R')
-        attacking_direction = team_direction
+    index = FrameIndex(frames)
+    player_team = index.player_team
     
     for i, frame in enumerate(frames):
         poss_event = frame.get('possessionEvents', {})
@@ -295,14 +327,17 @@ def identify_plays(frames: List[Dict], lookahead_frames: int = 3, max_radius: fl
         if not passer_id:
             continue
         
-        # Get passer team
-        passer_team = get_team_from_player([frame], passer_id)
+        # Get passer team (the passer must be tracked in the event frame,
+        # otherwise there is no passer position)
+        if passer_id not in index.players(i):
+            continue
+        passer_team = player_team.get(passer_id)
         if not passer_team:
             continue
         
         # Get passer position (current frame)
         event_time = frame.get('eventTime', 0)
-        passer_pos = get_player_position(frames, passer_id, event_time, lookahead_frames=0)
+        passer_pos = get_player_position(frames, passer_id, event_time, 0, index)
         
         # Get receiver position with lookahead
         receiver_pos = (0, 0)
@@ -311,13 +346,13 @@ def identify_plays(frames: List[Dict], lookahead_frames: int = 3, max_radius: fl
         
         if receiver_id:
             # Try to find receiver with lookahead
-            receiver_pos = get_player_position(frames, receiver_id, event_time, lookahead_frames)
-            receiver_team = get_team_from_player(frames[i:min(i+lookahead_frames+1, len(frames))], receiver_id)
+            receiver_pos = get_player_position(frames, receiver_id, event_time, lookahead_frames, index)
+            receiver_team = player_team.get(receiver_id)
             
             # If receiver not found, try closest player
             if receiver_pos == (0, 0) or receiver_team is None:
                 actual_receiver_id, rx, ry = find_closest_teammate(
-                    frames, receiver_id, passer_team, event_time, max_radius, lookahead_frames
+                    frames, receiver_id, passer_team, event_time, max_radius, lookahead_frames, index
                 )
                 if actual_receiver_id:
                     receiver_pos = (rx, ry)
@@ -326,18 +361,12 @@ def identify_plays(frames: List[Dict], lookahead_frames: int = 3, max_radius: fl
         # If still no receiver found, try closest player without target
         if not actual_receiver_id or receiver_pos == (0, 0):
             actual_receiver_id, rx, ry = find_closest_teammate(
-                frames, -1, passer_team, event_time, max_radius, lookahead_frames
+                frames, -1, passer_team, event_time, max_radius, lookahead_frames, index
             )
             if actual_receiver_id:
                 receiver_pos = (rx, ry)
                 receiver_team = passer_team
         
-        # Normalize coordinates for consistent direction
-        passer_norm = normalize_coordinates(passer_pos[0], passer_pos[1], passer_team, 
-                                           attacking_direction, pitch_length, pitch_width)
-        receiver_norm = normalize_coordinates(receiver_pos[0], receiver_pos[1], passer_team,
-                                             attacking_direction, pitch_length, pitch_width)
-        
         # Determine if pass continues the play
         is_successful = (outcome == 'C' and 
                         receiver_team == passer_team and 
@@ -354,10 +383,10 @@ def identify_plays(frames: List[Dict], lookahead_frames: int = 3, max_radius: fl
                     'passer_id': passer_id,
                     'receiver_id': actual_receiver_id,
                     'team': passer_team,
-                    'passer_x': passer_norm[0],
-                    'passer_y': passer_norm[1],
-                    'receiver_x': receiver_norm[0],
-                    'receiver_y': receiver_norm[1],
+                    'passer_x': passer_pos[0],
+                    'passer_y': passer_pos[1],
+                    'receiver_x': receiver_pos[0],
+                    'receiver_y': receiver_pos[1],
                     'outcome': outcome,
                     'frame_time': event_time
                 })
@@ -369,10 +398,10 @@ def identify_plays(frames: List[Dict], lookahead_frames: int = 3, max_radius: fl
                     'passer_id': passer_id,
                     'receiver_id': actual_receiver_id,
                     'team': passer_team,
-                    'passer_x': passer_norm[0],
-                    'passer_y': passer_norm[1],
-                    'receiver_x': receiver_norm[0],
-                    'receiver_y': receiver_norm[1],
+                    'passer_x': passer_pos[0],
+                    'passer_y': passer_pos[1],
+                    'receiver_x': receiver_pos[0],
+                    'receiver_y': receiver_pos[1],
                     'outcome': outcome,
                     'frame_time': event_time
                 }]
@@ -418,11 +447,13 @@ def pass_to_vector(pass_data: Dict, pitch_length: float = 105.0, pitch_width: fl
     delta_y = receiver_y - passer_y
     
     # Pass distance
-    distance = math.sqrt(delta_x**2 + delta_y**2)
+    distance = math.hypot(delta_x, delta_y)
     
     # Pitch zones (defensive=0, middle=1, attacking=2)
-    start_zone = 0 if passer_x < pitch_length/3 else (1 if passer_x < 2*pitch_length/3 else 2)
-    end_zone = 0 if receiver_x < pitch_length/3 else (1 if receiver_x < 2*pitch_length/3 else 2)
+    third = pitch_length / 3
+    two_thirds = 2 * pitch_length / 3
+    start_zone = 0 if passer_x < third else (1 if passer_x < two_thirds else 2)
+    end_zone = 0 if receiver_x < third else (1 if receiver_x < two_thirds else 2)
     
     # Normalized vertical positions
     start_y_norm = passer_y / pitch_width
@@ -443,30 +474,104 @@ def pass_to_vector(pass_data: Dict, pitch_length: float = 105.0, pitch_width: fl
     ])
 
 
-def dtw_distance(seq1: List[Dict], seq2: List[Dict], pitch_length: float = 105.0, 
-                pitch_width: float = 68.0) -> float:
+# Columns of a play feature matrix (see pass_to_vector)
+N_FEATURES = 8
+
+
+def plays_to_matrix(play: List[Dict], pitch_length: float = 105.0, pitch_width: float = 68.0,
+                    attacking_direction: str = 'R') -> np.ndarray:
     """
-    Calculate DTW distance between two pass sequences
-    Uses enhanced feature vectors with relative coordinates
+    Build the (n, 8) feature matrix of a play in one shot
+    Rows match pass_to_vector, computed column-wise over all passes and
+    stored as C-contiguous float32 (half the bytes per DTW cell)
+    
+    Raw coordinates are first normalized to a left-to-right attack, in bulk
+    for the whole play (see normalize_coordinates)
+    
+    Matrices are memoized by pass content, so a play that recurs (within or
+    across matches, or on re-analysis) is only converted once. The returned
+    array is shared and read-only
     """
-    # Convert to vectors
-    vectors1 = [pass_to_vector(p, pitch_length, pitch_width) for p in seq1]
-    vectors2 = [pass_to_vector(p, pitch_length, pitch_width) for p in seq2]
+    rows = tuple(
+        (p['passer_x'], p['passer_y'], p['receiver_x'], p['receiver_y'], p['outcome'] == 'C')
+        for p in play
+    )
+    return _rows_to_matrix(rows, pitch_length, pitch_width, attacking_direction)
+
+
+@lru_cache(maxsize=4096)
+def _rows_to_matrix(rows: Tuple[Tuple], pitch_length: float, pitch_width: float,
+                    attacking_direction: str) -> np.ndarray:
+    """Vectorized feature builder behind plays_to_matrix"""
+    coords = np.array([row[:4] for row in rows], dtype=np.float64).reshape(-1, 4)
+    passer_x, passer_y, receiver_x, receiver_y = coords.T
+    
+    # If team is attacking left, flip coordinates
+    if attacking_direction == 'L':
+        passer_x, receiver_x = pitch_length - passer_x, pitch_length - receiver_x
+        passer_y, receiver_y = -passer_y, -receiver_y
     
-    n, m = len(vectors1), len(vectors2)
+    # Pass direction vector and length
+    delta_x = receiver_x - passer_x
+    delta_y = receiver_y - passer_y
+    distance = np.hypot(delta_x, delta_y)
+    
+    # Pitch zones (defensive=0, middle=1, attacking=2); boundaries computed
+    # once for the whole play
+    edges = (pitch_length / 3, 2 * pitch_length / 3)
+    start_zone = np.digitize(passer_x, edges)
+    end_zone = np.digitize(receiver_x, edges)
+    
+    # Success indicator
+    success = np.array([row[4] for row in rows], dtype=np.float64)
+    
+    features = np.empty((len(rows), N_FEATURES), dtype=np.float32)
+    features[:, 0] = delta_x
+    features[:, 1] = delta_y
+    features[:, 2] = distance
+    features[:, 3] = start_zone
+    features[:, 4] = end_zone
+    features[:, 5] = passer_y / pitch_width
+    features[:, 6] = receiver_y / pitch_width
+    features[:, 7] = success
+    features.flags.writeable = False
+    return features
+
+
+# Default Sakoe-Chiba band half-width (in passes) for play DTW
+DTW_BAND = 5
+
+
+@njit(cache=True, fastmath=True, boundscheck=False)
+def _dtw_norm_jit(v1: np.ndarray, v2: np.ndarray, band: int = DTW_BAND) -> float:
+    """
+    Normalized DTW distance between two (n, 8) float32 pass feature matrices
+    Compiled with Numba; the Euclidean cost is a scalar loop over features
+    accumulated in float64
+    
+    Only cells within a Sakoe-Chiba band of max(band, |n - m|) around the
+    diagonal are filled. A small band trades a little recall on strongly
+    warped alignments for far fewer cells on long plays
+    """
+    n, m = v1.shape[0], v2.shape[0]
+    w = max(band, abs(n - m))
     
     # Initialize DTW matrix
     dtw = np.full((n + 1, m + 1), np.inf)
-    dtw[0, 0] = 0
+    dtw[0, 0] = 0.0
     
     # Fill DTW matrix
     for i in range(1, n + 1):
-        for j in range(1, m + 1):
-            # Euclidean distance between vectors
-            cost = np.linalg.norm(vectors1[i-1] - vectors2[j-1])
-            dtw[i, j] = cost + min(
+        for j in range(max(1, i - w), min(m, i + w) + 1):
+            # Euclidean distance between vectors (fixed-length squared sum, unrolled)
+            d = 0.0
+            for k in range(N_FEATURES):
+                t = np.float64(v1[i-1, k]) - np.float64(v2[j-1, k])
+                d += t * t
+            cost = math.sqrt(d)
+            dtw[i, j] = cost + min(min(
                 dtw[i-1, j],      # Insertion
-                dtw[i, j-1],      # Deletion
+                dtw[i, j-1]),     # Deletion
                 dtw[i-1, j-1]     # Match
             )
     
@@ -474,43 +579,198 @@ def dtw_distance(seq1: List[Dict], seq2: List[Dict], pitch_length: float = 105.0
     return dtw[n, m] / (n + m)
 
 
+def dtw_distance(seq1: List[Dict], seq2: List[Dict], pitch_length: float = 105.0, 
+                pitch_width: float = 68.0, band: int = DTW_BAND,
+                attacking_direction1: str = 'R', attacking_direction2: str = 'R') -> float:
+    """
+    Calculate DTW distance between two pass sequences
+    Uses enhanced feature vectors with relative coordinates
+    """
+    return dtw_norm(plays_to_matrix(seq1, pitch_length, pitch_width, attacking_direction1),
+                    plays_to_matrix(seq2, pitch_length, pitch_width, attacking_direction2), band)
+
+
+def endpoint_lower_bounds(mats1: List[np.ndarray], mats2: List[np.ndarray]) -> np.ndarray:
+    """
+    Lower bound on the (unnormalized) DTW cost of every play pair
+    
+    Every warping path starts at the first pair of passes and ends at the
+    last pair, so the sum of those two costs never exceeds the DTW cost
+    (LB_Kim). When both plays have a single pass, the two cells coincide
+    """
+    def endpoints(mats):
+        first = np.zeros((len(mats), N_FEATURES))
+        last = np.zeros((len(mats), N_FEATURES))
+        single = np.zeros(len(mats), dtype=bool)
+        for k, mat in enumerate(mats):
+            if len(mat) > 0:
+                first[k], last[k] = mat[0], mat[-1]
+                single[k] = len(mat) == 1
+        return first, last, single
+    
+    first1, last1, single1 = endpoints(mats1)
+    first2, last2, single2 = endpoints(mats2)
+    
+    first_cost = np.sqrt(((first1[:, None, :] - first2[None, :, :]) ** 2).sum(axis=-1))
+    last_cost = np.sqrt(((last1[:, None, :] - last2[None, :, :]) ** 2).sum(axis=-1))
+    return np.where(single1[:, None] & single2[None, :], first_cost, first_cost + last_cost)
+
+
+@njit(parallel=True, cache=True)
+def _pair_dtw_jit(A: np.ndarray, offA: np.ndarray, B: np.ndarray, offB: np.ndarray,
+             mask: np.ndarray, band: int, out: np.ndarray) -> None:
+    """
+    DTW distance of every masked play pair, rows computed in parallel
+    
+    A and B hold the passes of all plays stacked row-wise; play k of A is
+    A[offA[k]:offA[k+1]] (CSR-style offsets)
+    """
+    for k in prange(len(offA) - 1):
+        for l in range(len(offB) - 1):
+            if mask[k, l]:
+                out[k, l] = _dtw_norm_jit(A[offA[k]:offA[k+1]], B[offB[l]:offB[l+1]], band)
+
+
+# Kernels in use: the ahead-of-time build from _dtw_ext.py when present (no
+# JIT compilation at startup; its pair grid runs on one core), else the JIT
+# versions above
+try:
+    from _dtw import dtw_norm, pair_dtw
+except ImportError:
+    dtw_norm, pair_dtw = _dtw_norm_jit, _pair_dtw_jit
+
+
+def stack_plays(mats: List[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+    """Concatenate per-play matrices into one array plus CSR-style offsets"""
+    offsets = np.zeros(len(mats) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(mat) for mat in mats])
+    stacked = np.concatenate(mats, axis=0) if mats else np.zeros((0, N_FEATURES), dtype=np.float32)
+    return np.ascontiguousarray(stacked), offsets
+
+
+def dedupe_plays(mats: List[np.ndarray]) -> Tuple[List[np.ndarray], np.ndarray]:
+    """
+    Distinct feature matrices, plus for every play the index of its matrix
+    
+    Feature values come straight from the same JSON inputs, so identical
+    plays have byte-identical matrices
+    """
+    seen = {}
+    unique = []
+    inverse = np.empty(len(mats), dtype=np.intp)
+    for k, mat in enumerate(mats):
+        key = (mat.shape[0], mat.tobytes())
+        if key not in seen:
+            seen[key] = len(unique)
+            unique.append(mat)
+        inverse[k] = seen[key]
+    return unique, inverse
+
+
+def masked_pair_dtw(A: np.ndarray, offA: np.ndarray, inv1: np.ndarray,
+                    B: np.ndarray, offB: np.ndarray, inv2: np.ndarray,
+                    mask: np.ndarray, band: int, distances: np.ndarray) -> None:
+    """
+    Fill distances[mask] over the full play grid, running DTW only once per
+    pair of distinct plays (inv1/inv2 map plays to rows of A/B)
+    """
+    rows, cols = np.nonzero(mask)
+    unique_mask = np.zeros((len(offA) - 1, len(offB) - 1), dtype=bool)
+    unique_mask[inv1[rows], inv2[cols]] = True
+    unique_distances = np.full(unique_mask.shape, np.inf)
+    pair_dtw(A, offA, B, offB, unique_mask, band, unique_distances)
+    distances[rows, cols] = unique_distances[inv1[rows], inv2[cols]]
+
+
 def compare_plays(plays1: List[List[Dict]], plays2: List[List[Dict]], 
-                 pitch_length: float = 105.0, pitch_width: float = 68.0) -> List[Dict]:
+                 pitch_length: float = 105.0, pitch_width: float = 68.0,
+                 band: int = DTW_BAND, top_k: Optional[int] = None,
+                 attacking_direction1: str = 'R', attacking_direction2: str = 'R') -> List[Dict]:
     """
     Compare all plays between two matches
     Applies weighted scoring to favor longer sequences
-    """
-    similarities = []
+    Pass coordinates are raw; each match's attacking direction normalizes them
     
-    for i, play1 in enumerate(plays1):
-        for j, play2 in enumerate(plays2):
-            if len(play1) > 0 and len(play2) > 0:
-                distance = dtw_distance(play1, play2, pitch_length, pitch_width)
-                
-                # Base similarity score
-                base_similarity = 1 / (1 + distance)
-                
-                # Length bonus: reward longer plays
-                avg_length = (len(play1) + len(play2)) / 2.0
-                length_bonus = 1 + (avg_length - 3) * 0.1  # +10% per pass above minimum
-                length_bonus = min(length_bonus, 2.0)  # Cap at 2x bonus
-                
-                # Weighted similarity
-                weighted_similarity = base_similarity * length_bonus
-                
-                similarities.append({
-                    'play1_id': i,
-                    'play2_id': j,
-                    'play1_passes': len(play1),
-                    'play2_passes': len(play2),
-                    'dtw_distance': distance,
-                    'base_similarity': base_similarity,
-                    'length_bonus': length_bonus,
-                    'similarity_score': weighted_similarity
-                })
+    With top_k, only the top_k most similar pairs are returned; pairs whose
+    lower-bound similarity cannot reach the k-th best skip DTW
+    
+    Raises:
+        ValueError: If top_k is given and is less than 1
+    """
+    if top_k is not None and top_k < 1:
+        raise ValueError(f"top_k must be at least 1, got {top_k}")
+    
+    # Feature matrices are built once per play, not once per pair
+    mats1 = [plays_to_matrix(p, pitch_length, pitch_width, attacking_direction1) for p in plays1]
+    mats2 = [plays_to_matrix(p, pitch_length, pitch_width, attacking_direction2) for p in plays2]
+    
+    # Recurring plays are stacked once; their DTW results are shared
+    uniq1, inv1 = dedupe_plays(mats1)
+    uniq2, inv2 = dedupe_plays(mats2)
+    A, offA = stack_plays(uniq1)
+    B, offB = stack_plays(uniq2)
+    len1, len2 = np.diff(offA)[inv1], np.diff(offB)[inv2]
+    valid = (len1 > 0)[:, None] & (len2 > 0)[None, :]
+    
+    # Length bonus: reward longer plays
+    path_length = len1[:, None] + len2[None, :]
+    avg_length = path_length / 2.0
+    length_bonus = 1 + (avg_length - 3) * 0.1  # +10% per pass above minimum
+    length_bonus = np.minimum(length_bonus, 2.0)  # Cap at 2x bonus
+    
+    distances = np.full(valid.shape, np.inf)
+    
+    if top_k is None:
+        masked_pair_dtw(A, offA, inv1, B, offB, inv2, valid, band, distances)
+        computed = valid
+    else:
+        # Upper bound on each pair's weighted similarity
+        lower_bounds = endpoint_lower_bounds(mats1, mats2)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            upper = np.where(valid, length_bonus / (1 + lower_bounds / path_length), -np.inf)
+        
+        # Seed the threshold with the top_k most promising pairs (partial
+        # selection, no full sort), then compute only the pairs that can
+        # still reach it
+        seed = np.zeros(valid.shape, dtype=bool)
+        n_seed = min(top_k, upper.size)
+        if n_seed > 0:
+            seed.flat[np.argpartition(-upper, n_seed - 1, axis=None)[:n_seed]] = True
+        seed &= valid
+        masked_pair_dtw(A, offA, inv1, B, offB, inv2, seed, band, distances)
+        
+        seed_scores = np.sort((length_bonus / (1 + distances))[seed])[::-1]
+        threshold = seed_scores[top_k - 1] if len(seed_scores) >= top_k else -np.inf
+        rest = valid & ~seed & (upper >= threshold)
+        masked_pair_dtw(A, offA, inv1, B, offB, inv2, rest, band, distances)
+        computed = seed | rest
+    
+    # Base and weighted similarity over the whole grid
+    base_similarity = 1 / (1 + distances)
+    weighted_similarity = base_similarity * length_bonus
+    
+    # Sort by weighted similarity score (ties keep row-major pair order);
+    # for top_k a size-k heap replaces the full sort, and only the
+    # survivors get a result dict
+    pairs = np.flatnonzero(computed)
+    if top_k is None:
+        pairs = pairs[np.argsort(-weighted_similarity.flat[pairs], kind='stable')]
+    else:
+        scores = weighted_similarity.flat
+        pairs = np.array(heapq.nlargest(top_k, pairs, key=lambda p: scores[p]), dtype=np.intp)
     
-    # Sort by weighted similarity score
-    similarities.sort(key=lambda x: x['similarity_score'], reverse=True)
+    similarities = []
+    for i, j in zip(*np.unravel_index(pairs, computed.shape)):
+        similarities.append({
+            'play1_id': int(i),
+            'play2_id': int(j),
+            'play1_passes': int(len1[i]),
+            'play2_passes': int(len2[j]),
+            'dtw_distance': float(distances[i, j]),
+            'base_similarity': float(base_similarity[i, j]),
+            'length_bonus': float(length_bonus[i, j]),
+            'similarity_score': float(weighted_similarity[i, j])
+        })
     
     return similarities
 
@@ -575,6 +835,7 @@ def analyze_match(frames: List[Dict], lookahead: int = 3, max_radius: float = 5.
         },
         'plays': {
             'total_plays': len(plays),
+            'attacking_direction': get_attacking_direction(frames),
             'min_passes_filter': min_passes,
             'plays_data': [
                 {
@@ -589,6 +850,88 @@ def analyze_match(frames: List[Dict], lookahead: int = 3, max_radius: float = 5.
     }
 
 
+# ============================================================================
+# ANALYSIS ENTRYPOINT
+# ============================================================================
+
+def load_match(path: str) -> List[Dict]:
+    """Load a match's frame list (orjson parses the whole file in one native pass)"""
+    with open(path, 'rb') as f:
+        return orjson.loads(f.read())
+
+
+def run_analysis(match1_path: str, match2_path: Optional[str] = None, lookahead: int = 3,
+                 min_passes: int = 3, max_radius: float = 5.0, pitch_length: float = 105.0,
+                 pitch_width: float = 68.0, top_k: Optional[int] = None) -> Dict:
+    """
+    Analyze one match, or two matches plus their play similarities
+    
+    Args:
+        match1_path: Path to first match JSON file
+        match2_path: Optional path to second match JSON file
+        lookahead: Number of frames to look ahead
+        min_passes: Minimum passes required for a play
+        max_radius: Maximum search radius for closest player
+        pitch_length: Pitch length in meters
+        pitch_width: Pitch width in meters
+        top_k: Keep only the top_k most similar play pairs (None keeps all)
+    
+    Returns:
+        Analysis output (configuration, match1 and, with two files, match2 + similarities)
+    """
+    print(f"Configuration:")
+    print(f"  Lookahead: {lookahead} frames")
+    print(f"  Search radius: {max_radius}m")
+    print(f"  Minimum passes per play: {min_passes}")
+    print(f"  Pitch dimensions: {pitch_length}m x {pitch_width}m\n")
+    
+    # Load and analyze match 1
+    print(f"Loading {match1_path}...")
+    match1_data = load_match(match1_path)
+    
+    print("Analyzing match 1...")
+    match1_analysis = analyze_match(match1_data, lookahead, max_radius, min_passes, 
+                                   pitch_length, pitch_width)
+    
+    # Build output
+    output = {
+        'configuration': {
+            'lookahead_frames': lookahead,
+            'max_radius': max_radius,
+            'min_passes': min_passes,
+            'pitch_length': pitch_length,
+            'pitch_width': pitch_width
+        },
+        'match1': match1_analysis
+    }
+    
+    # If second match provided, compare
+    if match2_path is not None:
+        print(f"\nLoading {match2_path}...")
+        match2_data = load_match(match2_path)
+        
+        print("Analyzing match 2...")
+        match2_analysis = analyze_match(match2_data, lookahead, max_radius, min_passes,
+                                       pitch_length, pitch_width)
+        
+        plays1 = match1_analysis['plays']['plays_data']
+        plays2 = match2_analysis['plays']['plays_data']
+        
+        # Calculate similarity with weighted scoring
+        print("\nCalculating play similarities (with length weighting)...")
+        plays1_sequences = [p['passes'] for p in plays1]
+        plays2_sequences = [p['passes'] for p in plays2]
+        similarities = compare_plays(plays1_sequences, plays2_sequences, pitch_length, pitch_width,
+                                     top_k=top_k,
+                                     attacking_direction1=match1_analysis['plays']['attacking_direction'],
+                                     attacking_direction2=match2_analysis['plays']['attacking_direction'])
+        
+        output['match2'] = match2_analysis
+        output['similarities'] = similarities
+    
+    return output
+
+
 # ============================================================================
 # MAIN FUNCTION
 # ============================================================================
@@ -604,6 +947,7 @@ def main():
         print("  --minpasses N    Minimum passes per play (default: 3)")
         print("  --pitchlength L  Pitch length in meters (default: 105.0)")
         print("  --pitchwidth W   Pitch width in meters (default: 68.0)")
+        print("  --topk K         Keep only the K most similar play pairs (default: all)")
         print("  --output FILE    Output file path (default: integrated_analysis_output.json)")
         print("\nModes:")
         print("  One file:  Ball tracking + play identification")
@@ -616,6 +960,7 @@ def main():
     min_passes = 3
     pitch_length = 105.0
     pitch_width = 68.0
+    top_k = None
     output_file = 'integrated_analysis_output.json'
     json_files = []
     
@@ -636,6 +981,9 @@ def main():
         elif sys.argv[i] == '--pitchwidth' and i + 1 < len(sys.argv):
             pitch_width = float(sys.argv[i + 1])
             i += 2
+        elif sys.argv[i] == '--topk' and i + 1 < len(sys.argv):
+            top_k = int(sys.argv[i + 1])
+            i += 2
         elif sys.argv[i] == '--output' and i + 1 < len(sys.argv):
             output_file = sys.argv[i + 1]
             i += 2
@@ -643,58 +991,12 @@ def main():
             json_files.append(sys.argv[i])
             i += 1
     
-    print(f"Configuration:")
-    print(f"  Lookahead: {lookahead} frames")
-    print(f"  Search radius: {max_radius}m")
-    print(f"  Minimum passes per play: {min_passes}")
-    print(f"  Pitch dimensions: {pitch_length}m x {pitch_width}m\n")
-    
-    # Load and analyze match 1
-    print(f"Loading {json_files[0]}...")
-    with open(json_files[0], 'r') as f:
-        match1_data = json.load(f)
-    
-    print("Analyzing match 1...")
-    match1_analysis = analyze_match(match1_data, lookahead, max_radius, min_passes, 
-                                   pitch_length, pitch_width)
-    
-    # Build output
-    output = {
-        'configuration': {
-            'lookahead_frames': lookahead,
-            'max_radius': max_radius,
-            'min_passes': min_passes,
-            'pitch_length': pitch_length,
-            'pitch_width': pitch_width
-        },
-        'match1': match1_analysis
-    }
-    
-    # If second match provided, compare
-    if len(json_files) > 1:
-        print(f"\nLoading {json_files[1]}...")
-        with open(json_files[1], 'r') as f:
-            match2_data = json.load(f)
-        
-        print("Analyzing match 2...")
-        match2_analysis = analyze_match(match2_data, lookahead, max_radius, min_passes,
-                                       pitch_length, pitch_width)
-        
-        plays1 = match1_analysis['plays']['plays_data']
-        plays2 = match2_analysis['plays']['plays_data']
-        
-        # Calculate similarity with weighted scoring
-        print("\nCalculating play similarities (with length weighting)...")
-        plays1_sequences = [p['passes'] for p in plays1]
-        plays2_sequences = [p['passes'] for p in plays2]
-        similarities = compare_plays(plays1_sequences, plays2_sequences, pitch_length, pitch_width)
-        
-        output['match2'] = match2_analysis
-        output['similarities'] = similarities
+    output = run_analysis(json_files[0], json_files[1] if len(json_files) > 1 else None,
+                          lookahead, min_passes, max_radius, pitch_length, pitch_width, top_k)
     
     # Save output
-    with open(output_file, 'w') as f:
-        json.dump(output, f, indent=2)
+    with open(output_file, 'wb') as f:
+        f.write(orjson.dumps(output, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY))
     
     print(f"\n{'='*60}")
     print(f"Results saved to {output_file}")
@@ -3,33 +3,34 @@ Humming-Based Song Similarity Detection System
 Core melody matching engine using pitch extraction and Dynamic Time Warping
 """
 
+import os
+import threading
 import numpy as np
 import librosa
-import scipy.signal
+import scipy.ndimage
 import pickle
-from typing import List, Tuple, Dict, Optional
+import tempfile
+from typing import List, Tuple, Dict, Optional, Union, BinaryIO
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from pathlib import Path
+from numba import get_num_threads, njit, prange
 
 
 @dataclass
 class MelodySignature:
     """Represents the melodic contour of a song or humming"""
     pitch_contour: np.ndarray  # Array of +1, -1, 0 representing pitch movement
-    pitch_values: np.ndarray   # Original pitch values (for debugging)
+    pitch_values: np.ndarray   # Original pitch values, float32 (for debugging)
     song_id: str
     duration: float
 
     def save(self, file_path: Path) -> None:
-        """Serialize signature to disk using pickle."""
-        payload = {
-            'pitch_contour': self.pitch_contour,
-            'pitch_values': self.pitch_values,
-            'song_id': self.song_id,
-            'duration': self.duration
-        }
+        """Serialize signature to disk as consecutive .npy arrays (memory-mappable)."""
         with open(file_path, 'wb') as f:
-            pickle.dump(payload, f, protocol=pickle.HIGHEST_PROTOCOL)
+            np.save(f, np.asarray(self.duration, dtype=np.float64))
+            np.save(f, np.ascontiguousarray(self.pitch_contour, dtype=np.int8))
+            np.save(f, np.ascontiguousarray(self.pitch_values, dtype=np.float32))
 
     @staticmethod
     def from_payload(payload: object, song_id: str) -> "MelodySignature":
@@ -39,12 +40,123 @@ class MelodySignature:
         if isinstance(payload, dict):
             return MelodySignature(
                 pitch_contour=payload.get('pitch_contour', np.array([], dtype=np.int8)),
-                pitch_values=payload.get('pitch_values', np.array([], dtype=float)),
+                pitch_values=payload.get('pitch_values', np.array([], dtype=np.float32)),
                 song_id=payload.get('song_id', song_id),
                 duration=float(payload.get('duration', 0.0))
             )
         raise ValueError("Unsupported signature payload type")
 
+def _memmap_npy_arrays(file_path: Path, count: int) -> List[np.ndarray]:
+    """Memory-map `count` .npy arrays stored back-to-back in a single file."""
+    arrays = []
+    with open(file_path, 'rb') as f:
+        for _ in range(count):
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+            offset = f.tell()
+            size = int(np.prod(shape))
+            nbytes = size * dtype.itemsize
+
+            if shape == () or nbytes == 0:
+                array = np.fromfile(f, dtype=dtype, count=size).reshape(shape)
+            else:
+                array = np.memmap(file_path, dtype=dtype, mode='r', offset=offset, shape=shape,
+                                  order='F' if fortran_order else 'C')
+            arrays.append(array)
+            f.seek(offset + nbytes)
+    return arrays
+
+
+@njit(nogil=True, cache=True)
+def _sliding_median(x, w):
+    """
+    Running median over an odd window w, zero-padded at the edges like
+    scipy.signal.medfilt
+    
+    The window is kept sorted: each step swaps the outgoing sample for the
+    incoming one with a binary search and a short shift
+    """
+    n = len(x)
+    h = w // 2
+    out = np.empty(n, dtype=x.dtype)
+    
+    window = np.zeros(w, dtype=x.dtype)
+    for k in range(min(h + 1, n)):
+        window[h + k] = x[k]
+    window.sort()
+    
+    for i in range(n):
+        out[i] = window[h]
+        old = x[i - h] if i - h >= 0 else 0.0
+        new = x[i + h + 1] if i + h + 1 < n else 0.0
+        
+        # Replace old with new, keeping the window sorted
+        p = np.searchsorted(window, old)
+        if new > old:
+            while p + 1 < w and window[p + 1] < new:
+                window[p] = window[p + 1]
+                p += 1
+        else:
+            while p > 0 and window[p - 1] > new:
+                window[p] = window[p - 1]
+                p -= 1
+        window[p] = new
+    
+    return out
+
+
+@njit(nogil=True, cache=True)
+def _pitch_to_contour(pitch, window, threshold):
+    """
+    Moving-average smoothing, first difference and thresholding in one pass
+    
+    The smoothing is zero-padded at the edges like np.convolve(..., mode='same')
+    and skipped when pitch is shorter than the window. Consecutive window sums
+    share all but one sample, so each difference is (entering - leaving) / window
+    """
+    n = len(pitch)
+    h = window // 2
+    out = np.empty(n - 1, dtype=np.int8)
+    
+    for i in range(n - 1):
+        if n < window:
+            d = pitch[i + 1] - pitch[i]
+        else:
+            entering = pitch[i + window - h] if i + window - h < n else 0.0
+            leaving = pitch[i - h] if i - h >= 0 else 0.0
+            d = (entering - leaving) / window
+        
+        if d > threshold:
+            out[i] = 1
+        elif d < -threshold:
+            out[i] = -1
+        else:
+            out[i] = 0
+    
+    return out
+
+
+def _resample_contour(contour: np.ndarray, length: int) -> np.ndarray:
+    """Stretch a contour to a fixed number of frames (nearest of -1, 0, +1)"""
+    if len(contour) == 0:
+        return np.zeros(length, dtype=np.int8)
+    positions = np.linspace(0, len(contour) - 1, length)
+    return np.interp(positions, np.arange(len(contour)), contour).round().astype(np.int8)
+
+
+def _pack_arrays(arrays: List[np.ndarray], dtype) -> Tuple[np.ndarray, np.ndarray]:
+    """Concatenate arrays into (flat, offsets) with flat[offsets[i]:offsets[i+1]] == arrays[i]"""
+    offsets = np.zeros(len(arrays) + 1, dtype=np.int64)
+    np.cumsum([len(a) for a in arrays], out=offsets[1:])
+    flat = np.empty(offsets[-1], dtype=dtype)
+    for i, array in enumerate(arrays):
+        flat[offsets[i]:offsets[i + 1]] = array
+    return flat, offsets
+
+
 class PitchExtractor:
     """Extract fundamental frequency (F0) from audio signals"""
     
@@ -53,7 +165,8 @@ class PitchExtractor:
                  frame_length: int = 2048,
                  hop_length: int = 512,
                  fmin: float = 80.0,    # Minimum frequency (Hz)
-                 fmax: float = 800.0):  # Maximum frequency (Hz)
+                 fmax: float = 800.0,   # Maximum frequency (Hz)
+                 use_yin: bool = False):
         """
         Initialize pitch extractor
         
@@ -63,29 +176,59 @@ class PitchExtractor:
             hop_length: Number of samples between frames
             fmin: Minimum expected pitch (Hz) - typical male humming
             fmax: Maximum expected pitch (Hz) - typical female humming
+            use_yin: Track pitch with plain YIN plus an energy gate instead of
+                     pYIN (much faster, slightly different contours; keep one
+                     setting per database)
         """
         self.sample_rate = sample_rate
         self.frame_length = frame_length
         self.hop_length = hop_length
         self.fmin = fmin
         self.fmax = fmax
+        self.use_yin = use_yin
     
-    def extract_pitch(self, audio_path: str, duration: Optional[float] = None) -> np.ndarray:
+    def extract_pitch(self, audio_path: Union[str, BinaryIO], duration: Optional[float] = None) -> np.ndarray:
         """
         Extract pitch contour from audio file
         
         Args:
-            audio_path: Path to audio file
+            audio_path: Path to audio file, or a seekable file-like object
             duration: Optional duration to analyze (seconds)
             
         Returns:
             Array of pitch values (Hz) over time
         """
-        # Load audio file
+        # Load audio file (file-like objects may be decoded more than once)
+        if hasattr(audio_path, 'seek'):
+            audio_path.seek(0)
         y, sr = librosa.load(audio_path, sr=self.sample_rate, duration=duration, mono=True)
         
-        # Extract pitch using pYIN algorithm (robust for vocal pitch tracking)
-        f0, voiced_flag, voiced_probs = librosa.pyin(
+        if self.use_yin:
+            f0, voiced_flag, voiced_probs = self._yin(y, sr)
+        else:
+            # Extract pitch using pYIN algorithm (robust for vocal pitch tracking)
+            f0, voiced_flag, voiced_probs = librosa.pyin(
+                y,
+                fmin=self.fmin,
+                fmax=self.fmax,
+                sr=sr,
+                frame_length=self.frame_length,
+                hop_length=self.hop_length
+            )
+        
+        # Clean up pitch values
+        pitch_cleaned = self._clean_pitch(f0, voiced_flag, voiced_probs)
+        
+        return pitch_cleaned #send to contour 
+    
+    def _yin(self, y: np.ndarray, sr: int, silence_db: float = -40.0) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Track pitch with YIN, gating voicing on frame energy
+        
+        Returns:
+            (f0, voiced_flag, voiced_probs) shaped like librosa.pyin's output
+        """
+        f0 = librosa.yin(
             y,
             fmin=self.fmin,
             fmax=self.fmax,
@@ -94,10 +237,13 @@ class PitchExtractor:
             hop_length=self.hop_length
         )
         
-        # Clean up pitch values
-        pitch_cleaned = self._clean_pitch(f0, voiced_flag, voiced_probs)
+        # Frames within silence_db of the loudest frame count as voiced;
+        # YIN pins unpitched frames to the edges of the search range
+        rms = librosa.feature.rms(y=y, frame_length=self.frame_length, hop_length=self.hop_length)[0]
+        loud = librosa.amplitude_to_db(rms, ref=np.max) > silence_db
+        voiced_flag = loud & (f0 > self.fmin) & (f0 < self.fmax)
         
-        return pitch_cleaned #send to contour 
+        return f0, voiced_flag, voiced_flag.astype(np.float64)
     
     def _clean_pitch(self, f0: np.ndarray, voiced_flag: np.ndarray, 
                      voiced_probs: np.ndarray, confidence_threshold: float = 0.3) -> np.ndarray:
@@ -113,12 +259,8 @@ class PitchExtractor:
         Returns:
             Cleaned pitch array
         """
-        # Create copy to avoid modifying original
-        pitch = f0.copy()
-        
-        # Remove low confidence and unvoiced segments
-        pitch[voiced_probs < confidence_threshold] = np.nan
-        pitch[~voiced_flag] = np.nan
+        # Remove low confidence and unvoiced segments (new array, f0 untouched)
+        pitch = np.where(voiced_flag & (voiced_probs >= confidence_threshold), f0, np.nan)
         
         # Interpolate short gaps (up to 5 frames)
         pitch = self._interpolate_gaps(pitch, max_gap=5)
@@ -126,7 +268,8 @@ class PitchExtractor:
         # Apply median filter to remove outliers
         pitch = self._median_filter(pitch, window=5)
         
-        return pitch
+        # Hz-scale pitch needs no more than float32
+        return pitch.astype(np.float32)
     
     def _interpolate_gaps(self, pitch: np.ndarray, max_gap: int = 5) -> np.ndarray:
         """Interpolate small gaps in pitch sequence"""
@@ -136,31 +279,32 @@ class PitchExtractor:
         if not nans.any():
             return pitch
         
-        # Find start and end of NaN segments
-        nans_idx = np.where(nans)[0]
-        not_nans_idx = np.where(~nans)[0]
+        # Find start and end of NaN runs in one pass over the mask
+        edges = np.diff(np.concatenate(([0], nans.view(np.int8), [0])))
+        starts = np.flatnonzero(edges == 1)
+        ends = np.flatnonzero(edges == -1)
+        
+        # The very first and very last NaN frames are never filled
+        first_nan, last_nan = starts[0], ends[-1] - 1
         
-        if len(not_nans_idx) < 2:
+        # Only small gaps with valid pitch on both sides are filled
+        small = (starts > 0) & (ends < len(pitch)) & (ends - starts + 1 <= max_gap)
+        lo = np.maximum(starts[small], first_nan + 1)
+        hi = np.minimum(ends[small], last_nan)
+        lo, hi = lo[hi > lo], hi[hi > lo]
+        
+        # Mark frames lo..hi-1 of every gap (gaps never overlap)
+        marks = np.zeros(len(pitch) + 1, dtype=np.int8)
+        marks[lo] = 1
+        marks[hi] = -1
+        fill = np.flatnonzero(np.cumsum(marks[:-1]))
+        if len(fill) == 0:
             return pitch
         
-        # Interpolate only small gaps
-        for i in range(len(nans_idx)):
-            if i == 0 or i == len(nans_idx) - 1:
-                continue
-                
-            # Check if gap is small enough
-            prev_valid = not_nans_idx[not_nans_idx < nans_idx[i]]
-            next_valid = not_nans_idx[not_nans_idx > nans_idx[i]]
-            
-            if len(prev_valid) > 0 and len(next_valid) > 0:
-                gap_size = next_valid[0] - prev_valid[-1]
-                if gap_size <= max_gap:
-                    # Linear interpolation
-                    pitch[nans_idx[i]] = np.interp(
-                        nans_idx[i],
-                        [prev_valid[-1], next_valid[0]],
-                        [pitch[prev_valid[-1]], pitch[next_valid[0]]]
-                    )
+        # Linear interpolation; the valid frames either side of each gap are
+        # its neighbours in the valid index list, found once by np.interp
+        valid = np.flatnonzero(~nans)
+        pitch[fill] = np.interp(fill, valid, pitch[valid])
         
         return pitch
     
@@ -169,10 +313,16 @@ class PitchExtractor:
         pitch_filtered = pitch.copy()
         valid_idx = ~np.isnan(pitch)
         
-        if valid_idx.sum() > window:
-            pitch_filtered[valid_idx] = scipy.signal.medfilt(
-                pitch[valid_idx], 
-                kernel_size=window
+        if valid_idx.sum() > 1024 and window % 2 == 1:
+            # Long captures: incremental sliding window instead of a sort per sample
+            pitch_filtered[valid_idx] = _sliding_median(pitch[valid_idx], window)
+        elif valid_idx.sum() > window:
+            # Zero padding at the edges, same as scipy.signal.medfilt
+            pitch_filtered[valid_idx] = scipy.ndimage.median_filter(
+                pitch[valid_idx],
+                size=window,
+                mode='constant',
+                cval=0.0
             )
         
         return pitch_filtered
@@ -209,33 +359,17 @@ class ContourExtractor:
         pitch_valid = pitch[valid_idx]
         
         if len(pitch_valid) < 2:
-            return np.array([])
-        
-        # Smooth pitch to reduce noise
-        pitch_smooth = self._smooth_pitch(pitch_valid)
-        
-        # Compute pitch differences
-        pitch_diff = np.diff(pitch_smooth)
+            return np.array([], dtype=np.int8)
         
-        # Convert to contour representation
-        contour = np.zeros_like(pitch_diff, dtype=np.int8)
-        contour[pitch_diff > self.pitch_threshold] = 1   # Up
-        contour[pitch_diff < -self.pitch_threshold] = -1  # Down
-        # pitch_diff within threshold remains 0 (stable)
+        # Smooth pitch to reduce noise and convert its differences to contour
+        # representation: +1 up, -1 down, 0 (stable) within the threshold
+        contour = _pitch_to_contour(pitch_valid, self.smoothing_window, self.pitch_threshold)
         
         # Further smooth contour to remove rapid fluctuations
         contour = self._smooth_contour(contour)
         
         return contour
     
-    def _smooth_pitch(self, pitch: np.ndarray) -> np.ndarray:
-        """Apply moving average to smooth pitch"""
-        if len(pitch) < self.smoothing_window:
-            return pitch
-        
-        kernel = np.ones(self.smoothing_window) / self.smoothing_window
-        return np.convolve(pitch, kernel, mode='same')
-    
     def _smooth_contour(self, contour: np.ndarray, min_duration: int = 2) -> np.ndarray:
         """
         Remove very short contour segments
@@ -271,9 +405,166 @@ class ContourExtractor:
         return np.array(result, dtype=np.int8)
 
 
+# Contour distance table indexed [a + 1, b + 1]:
+# 0 if same, 1 if one side is stable, 2 if opposite directions
+_COST = np.array([[0, 1, 2],
+                  [1, 0, 1],
+                  [2, 1, 0]], dtype=np.float32)
+
+
+@njit(nogil=True, cache=True, fastmath=True)
+def _dtw_rows(query, reference, window, max_cost, prev, curr):
+    """
+    Normalized DTW distance between int8 contours within a Sakoe-Chiba band
+    (runs without the GIL)
+    
+    Returns inf as soon as every cell of a row exceeds max_cost, since the
+    accumulated cost can only grow from there. prev and curr are caller-owned
+    float32 row buffers of at least m+1 cells
+    """
+    n, m = len(query), len(reference)
+    
+    # Only the previous row is needed: two rolling rows instead of the full matrix
+    # (costs are small integers, exact in float32)
+    prev[:m + 1] = np.inf
+    prev[0] = 0.0
+    
+    for i in range(1, n + 1):
+        # Sakoe-Chiba band
+        j_start = max(1, i - window)
+        j_end = min(m + 1, i + window)
+        cost_row = _COST[query[i-1] + 1]
+        curr[:m + 1] = np.inf
+        row_min = np.inf
+        
+        for j in range(j_start, j_end):
+            # DTW recurrence relation
+            curr[j] = cost_row[reference[j-1] + 1] + min(
+                prev[j],      # Insertion
+                curr[j-1],    # Deletion
+                prev[j-1]     # Match
+            )
+            row_min = min(row_min, curr[j])
+        
+        # Early abandon: no alignment through this row can end under max_cost
+        if row_min > max_cost:
+            return np.inf
+        
+        prev, curr = curr, prev
+    
+    # Normalize by path length to make distances comparable
+    return prev[m] / (n + m)
+
+
+@njit(nogil=True, cache=True)
+def _dtw_int8(query, reference, window, max_cost):
+    """Normalized DTW distance between int8 contours (see _dtw_rows)"""
+    prev = np.empty(len(reference) + 1, dtype=np.float32)
+    return _dtw_rows(query, reference, window, max_cost, prev, np.empty_like(prev))
+
+
+@njit(parallel=True, nogil=True, cache=True)
+def _dtw_all(query, flat, offsets, songs, window_size, max_distance, n_tasks, out):
+    """
+    Normalized DTW distance from query to the packed references listed in
+    songs (out[k] for songs[k]); window_size < 0 means no band constraint
+    
+    Songs are dealt round-robin to n_tasks tasks (one per thread), and each
+    task allocates its row buffers once for all of its songs
+    """
+    n = len(query)
+    n_songs = len(songs)
+    n_tasks = min(n_tasks, n_songs)
+    max_len = 0
+    for s in songs:
+        max_len = max(max_len, offsets[s + 1] - offsets[s])
+    
+    for task in prange(n_tasks):
+        prev = np.empty(max_len + 1, dtype=np.float32)
+        curr = np.empty_like(prev)
+        for k in range(task, n_songs, n_tasks):
+            s = songs[k]
+            reference = flat[offsets[s]:offsets[s + 1]]
+            m = len(reference)
+            if m == 0:
+                out[k] = np.inf
+                continue
+            if window_size >= 0:
+                window = max(window_size, abs(n - m))
+            else:
+                window = max(n, m)
+            out[k] = _dtw_rows(query, reference, window, max_distance * (n + m), prev, curr)
+
+
+@njit(parallel=True, nogil=True, cache=True)
+def _lb_keogh_all(query, counts, offsets, window_size, out):
+    """
+    LB_Keogh lower bound on the normalized DTW distance from query to every
+    packed reference; counts[k, v + 1] is the number of values v in flat[:k]
+    
+    The band width depends on both lengths, so each query frame's reference
+    envelope is read off the prefix counts instead of a fixed-width filter
+    """
+    n = len(query)
+    for s in prange(len(offsets) - 1):
+        base = offsets[s]
+        m = offsets[s + 1] - base
+        if window_size >= 0:
+            window = max(window_size, abs(n - m))
+        else:
+            window = max(n, m)
+        
+        # The end cell (n, m) has to lie inside the last row's band
+        if m == 0 or n + window <= m:
+            out[s] = np.inf
+            continue
+        
+        total = 0.0
+        for i in range(1, n + 1):
+            # Same Sakoe-Chiba band as _dtw_rows, as flat indices
+            lo = base + max(1, i - window) - 1
+            hi = base + min(m + 1, i + window) - 1
+            if lo >= hi:
+                total = np.inf
+                break
+            
+            # Envelope of the reference values inside the band
+            if counts[hi, 2] > counts[lo, 2]:
+                upper = 1
+            elif counts[hi, 1] > counts[lo, 1]:
+                upper = 0
+            else:
+                upper = -1
+            if counts[hi, 0] > counts[lo, 0]:
+                lower = -1
+            elif counts[hi, 1] > counts[lo, 1]:
+                lower = 0
+            else:
+                lower = 1
+            
+            q = np.int64(query[i-1])
+            total += max(0, q - upper) + max(0, lower - q)
+        out[s] = total / (n + m)
+
+
+# Parallel kernels run without the GIL, so other threads keep decoding and
+# tracking pitch meanwhile; launches are serialized because Numba's default
+# workqueue threading layer cannot run two parallel regions at once
+_PARALLEL_LOCK = threading.Lock()
+
+
+# Compile once at import so the first request doesn't pay for it. Only the
+# serial kernel: running a parallel one starts Numba's worker threads, and a
+# process that later forks with those threads running hangs at exit. The
+# parallel kernels compile (or load from the cache) on first use
+_dtw_int8(np.zeros(1, dtype=np.int8), np.zeros(1, dtype=np.int8), 1, np.inf)
+
+
 class DTWMatcher:
     """Dynamic Time Warping for melody contour matching"""
     
+    _COST = _COST
+    
     def __init__(self, window_size: Optional[int] = None):
         """
         Initialize DTW matcher
@@ -284,13 +575,16 @@ class DTWMatcher:
         """
         self.window_size = window_size
     
-    def compute_distance(self, query: np.ndarray, reference: np.ndarray) -> float:
+    def compute_distance(self, query: np.ndarray, reference: np.ndarray,
+                         threshold: float = float('inf')) -> float:
         """
         Compute DTW distance between query and reference contours
         
         Args:
             query: Query contour sequence
             reference: Reference contour sequence
+            threshold: Normalized distance above which the computation is
+                       abandoned early (returns inf)
             
         Returns:
             Normalized DTW distance (lower is more similar)
@@ -300,37 +594,15 @@ class DTWMatcher:
         if n == 0 or m == 0:
             return float('inf')
         
-        # Initialize cost matrix
-        dtw_matrix = np.full((n + 1, m + 1), np.inf)
-        dtw_matrix[0, 0] = 0
-        
         # Apply window constraint if specified
         if self.window_size is not None:
             window = max(self.window_size, abs(n - m))
         else:
             window = max(n, m)
         
-        # Fill DTW matrix
-        for i in range(1, n + 1):
-            # Sakoe-Chiba band
-            j_start = max(1, i - window)
-            j_end = min(m + 1, i + window)
-            
-            for j in range(j_start, j_end):
-                # Cost function: 0 if same, 1 if different, 2 if opposite direction
-                cost = self._contour_distance(query[i-1], reference[j-1])
-                
-                # DTW recurrence relation
-                dtw_matrix[i, j] = cost + min(
-                    dtw_matrix[i-1, j],      # Insertion
-                    dtw_matrix[i, j-1],      # Deletion
-                    dtw_matrix[i-1, j-1]     # Match
-                )
-        
-        # Normalize by path length to make distances comparable
-        distance = dtw_matrix[n, m] / (n + m)
-        
-        return distance
+        query = np.ascontiguousarray(query, dtype=np.int8)
+        reference = np.ascontiguousarray(reference, dtype=np.int8)
+        return float(_dtw_int8(query, reference, window, threshold * (n + m)))
     
     def _contour_distance(self, a: int, b: int) -> float:
         """
@@ -342,12 +614,7 @@ class DTWMatcher:
         Returns:
             Distance score
         """
-        if a == b:
-            return 0.0
-        elif a * b == -1:  # Opposite directions
-            return 2.0
-        else:  # One stable, one moving
-            return 1.0
+        return float(self._COST[int(a) + 1, int(b) + 1])
 
 
 class MelodyDatabase:
@@ -357,6 +624,17 @@ class MelodyDatabase:
         self.signatures: Dict[str, MelodySignature] = {}
         self.pitch_extractor = PitchExtractor()
         self.contour_extractor = ContourExtractor()
+        # Packed contours (flat, offsets, song_ids) and their value prefix counts, rebuilt lazily;
+        # derived arrays are kept with the packed tuple they were built from
+        self._packed: Optional[Tuple[np.ndarray, np.ndarray, List[str]]] = None
+        self._counts: Optional[Tuple[tuple, np.ndarray]] = None
+        # Contours resampled to resample_length frames, one row per packed song
+        self.resample_length = 512
+        self._resampled: Optional[Tuple[tuple, np.ndarray]] = None
+        # File the packed arrays are memory-mapped from (see load)
+        self._mapped_path: Optional[Path] = None
+        # Bumped on every catalog change so callers can invalidate derived caches
+        self.version = 0
     
     def add_song(self, song_id: str, audio_path: str, duration: Optional[float] = 30.0):
         """
@@ -367,6 +645,36 @@ class MelodyDatabase:
             audio_path: Path to audio file
             duration: Duration to analyze (seconds)
         """
+        signature = self.extract_signature(song_id, audio_path, duration)
+        self.register(song_id, signature)
+        return signature
+    
+    def add_songs(self, items: List[Tuple[str, str]], duration: Optional[float] = 30.0,
+                  workers: Optional[int] = None) -> List[MelodySignature]:
+        """
+        Add several songs, loading and analyzing them on a thread pool
+        
+        Args:
+            items: (song_id, audio_path) pairs
+            duration: Duration to analyze (seconds)
+            workers: Number of threads (default: CPU count)
+            
+        Returns:
+            Signatures in the same order as items
+        """
+        # Decoding and pitch tracking release the GIL; registering stays on this thread
+        with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+            signatures = list(executor.map(
+                lambda item: self.extract_signature(item[0], item[1], duration), items
+            ))
+        
+        for signature in signatures:
+            self.register(signature.song_id, signature)
+        return signatures
+    
+    def extract_signature(self, song_id: str, audio_path: str,
+                          duration: Optional[float] = 30.0) -> MelodySignature:
+        """Compute a song's signature without adding it to the database"""
         # Extract pitch
         pitch = self.pitch_extractor.extract_pitch(audio_path, duration)
         
@@ -374,16 +682,28 @@ class MelodyDatabase:
         contour = self.contour_extractor.extract_contour(pitch)
         
         # Create signature
-        signature = MelodySignature(
+        return MelodySignature(
             pitch_contour=contour,
             pitch_values=pitch,
             song_id=song_id,
             duration=duration or 0.0
         )
-        
+    
+    def register(self, song_id: str, signature: MelodySignature) -> None:
+        """Store a precomputed signature"""
         self.signatures[song_id] = signature
-        
-        return signature
+        self._packed = None
+        self._counts = None
+        self._resampled = None
+        self.version += 1
+    
+    def remove_song(self, song_id: str) -> None:
+        """Remove a song from the database"""
+        del self.signatures[song_id]
+        self._packed = None
+        self._counts = None
+        self._resampled = None
+        self.version += 1
     
     def get_signature(self, song_id: str) -> Optional[MelodySignature]:
         """Retrieve a stored signature"""
@@ -392,40 +712,201 @@ class MelodyDatabase:
     def load_signature(self, song_id: str, signature_path: Path) -> MelodySignature:
         """Load a signature from disk and store it in memory."""
         with open(signature_path, 'rb') as f:
-            payload = pickle.load(f)
+            is_npy = f.read(len(np.lib.format.MAGIC_PREFIX)) == np.lib.format.MAGIC_PREFIX
+
+        if is_npy:
+            # Arrays stay memory-mapped; pages are read on first access
+            duration, pitch_contour, pitch_values = _memmap_npy_arrays(signature_path, 3)
+            signature = MelodySignature(
+                pitch_contour=pitch_contour,
+                pitch_values=pitch_values,
+                song_id=song_id,
+                duration=float(duration)
+            )
+        else:
+            # Legacy pickle signature, migrated once to the .npy layout
+            with open(signature_path, 'rb') as f:
+                payload = pickle.load(f)
+            signature = MelodySignature.from_payload(payload, song_id)
+            # Written beside the original and swapped in, so a crash or a
+            # concurrent reader never sees a half-written .sig
+            fd, tmp_path = tempfile.mkstemp(dir=Path(signature_path).parent, suffix='.tmp')
+            os.close(fd)
+            try:
+                signature.save(tmp_path)
+                os.replace(tmp_path, signature_path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
 
-        signature = MelodySignature.from_payload(payload, song_id)
         # Ensure song_id is consistent with filename
         signature.song_id = song_id
-        self.signatures[song_id] = signature
+        self.register(song_id, signature)
         return signature
     
+    def save(self, file_path: Path) -> None:
+        """
+        Write every signature to one file of consecutive .npy arrays
+        (memory-mappable, see load)
+        """
+        # Windows cannot replace a file that is still mapped: when overwriting
+        # the file this database was loaded from, copy its arrays out first
+        if self._mapped_path is not None and Path(file_path).resolve() == self._mapped_path:
+            self._unmap()
+        
+        flat, offsets, song_ids = self.packed()
+        signatures = [self.signatures[sid] for sid in song_ids]
+        pitch_flat, pitch_offsets = _pack_arrays([s.pitch_values for s in signatures], np.float32)
+        
+        # Write beside the target and swap it in: the old file may still be mapped
+        tmp_path = Path(str(file_path) + '.tmp')
+        with open(tmp_path, 'wb') as f:
+            np.save(f, flat)
+            np.save(f, offsets)
+            np.save(f, pitch_flat)
+            np.save(f, pitch_offsets)
+            np.save(f, np.array([s.duration for s in signatures], dtype=np.float64))
+            np.save(f, np.array(song_ids, dtype=str))
+        os.replace(tmp_path, file_path)
+    
+    def load(self, file_path: Path) -> None:
+        """
+        Replace the database with the signatures in a file written by save()
+        
+        Arrays stay memory-mapped: signatures are views into the file and the
+        packed contours are handed to the matcher without copying
+        """
+        flat, offsets, pitch_flat, pitch_offsets, durations, ids = (
+            array.view(np.ndarray) for array in _memmap_npy_arrays(file_path, 6)
+        )
+        song_ids = [str(song_id) for song_id in ids]
+        
+        self.signatures = {
+            song_id: MelodySignature(
+                pitch_contour=flat[offsets[i]:offsets[i + 1]],
+                pitch_values=pitch_flat[pitch_offsets[i]:pitch_offsets[i + 1]],
+                song_id=song_id,
+                duration=float(durations[i])
+            )
+            for i, song_id in enumerate(song_ids)
+        }
+        self._packed = (flat, offsets, song_ids)
+        self._counts = None
+        self._resampled = None
+        self._mapped_path = Path(file_path).resolve()
+        self.version += 1
+    
+    def _unmap(self) -> None:
+        """Copy every signature out of the mapped file so the mapping is released"""
+        for signature in self.signatures.values():
+            signature.pitch_contour = np.array(signature.pitch_contour)
+            signature.pitch_values = np.array(signature.pitch_values)
+        self._packed = None
+        self._counts = None
+        self._resampled = None
+        self._mapped_path = None
+    
     def list_songs(self) -> List[str]:
         """List all song IDs in database"""
         return list(self.signatures.keys())
+    
+    def packed(self) -> Tuple[np.ndarray, np.ndarray, List[str]]:
+        """
+        Get all contours packed back-to-back into one contiguous array
+        
+        Returns:
+            (flat, offsets, song_ids) where flat[offsets[i]:offsets[i+1]]
+            is the contour of song_ids[i]
+        
+        The tuple is never modified: a catalog change builds a new one, so
+        callers holding a snapshot can keep using it
+        """
+        packed = self._packed
+        if packed is None:
+            packed = self._rebuild_packed()
+        return packed
+    
+    def value_counts(self, packed: Optional[Tuple[np.ndarray, np.ndarray, List[str]]] = None) -> np.ndarray:
+        """
+        Prefix counts of contour values over the packed flat array
+        
+        Args:
+            packed: Snapshot from packed() to count over (default: the current one)
+        
+        Returns:
+            (len(flat) + 1, 3) int32 array; [k, v + 1] counts value v in flat[:k]
+        """
+        if packed is None:
+            packed = self.packed()
+        cached = self._counts
+        if cached is not None and cached[0] is packed:
+            return cached[1]
+        flat = packed[0]
+        counts = np.zeros((len(flat) + 1, 3), dtype=np.int32)
+        for v in (-1, 0, 1):
+            np.cumsum(flat == v, out=counts[1:, v + 1])
+        self._counts = (packed, counts)
+        return counts
+    
+    def resampled(self, packed: Optional[Tuple[np.ndarray, np.ndarray, List[str]]] = None) -> np.ndarray:
+        """
+        Every packed contour stretched to resample_length frames
+        
+        Args:
+            packed: Snapshot from packed() to resample (default: the current one)
+        
+        Returns:
+            (n_songs, resample_length) int8 array, rows in packed() order
+        """
+        if packed is None:
+            packed = self.packed()
+        cached = self._resampled
+        if cached is not None and cached[0] is packed:
+            return cached[1]
+        flat, offsets, _ = packed
+        matrix = np.empty((len(offsets) - 1, self.resample_length), dtype=np.int8)
+        for i in range(len(offsets) - 1):
+            matrix[i] = _resample_contour(flat[offsets[i]:offsets[i + 1]], self.resample_length)
+        self._resampled = (packed, matrix)
+        return matrix
+    
+    def _rebuild_packed(self) -> Tuple[np.ndarray, np.ndarray, List[str]]:
+        """Repack every signature contour into a single flat int8 array"""
+        items = list(self.signatures.items())
+        flat, offsets = _pack_arrays([signature.pitch_contour for _, signature in items], np.int8)
+        packed = (flat, offsets, [song_id for song_id, _ in items])
+        self._packed = packed
+        self._counts = None
+        self._resampled = None
+        return packed
 
 
 class HummingMatcher:
     """Main system for matching humming to songs"""
     
-    def __init__(self, database: MelodyDatabase):
+    def __init__(self, database: MelodyDatabase, coarse_factor: Optional[int] = None):
         """
         Initialize matcher
         
         Args:
             database: Pre-populated melody database
+            coarse_factor: If set, only the top_k * coarse_factor songs whose
+                           resampled contours mismatch the query's the least
+                           go on to DTW (approximate, much less DTW work on
+                           large databases); None compares every song
         """
         self.database = database
+        self.coarse_factor = coarse_factor
         self.pitch_extractor = PitchExtractor()
         self.contour_extractor = ContourExtractor()
         self.dtw_matcher = DTWMatcher(window_size=50)
     
-    def match_humming(self, humming_path: str, top_k: int = 5) -> List[Tuple[str, float]]:
+    def match_humming(self, humming_path: Union[str, BinaryIO], top_k: int = 5) -> List[Tuple[str, float]]:
         """
         Match humming to songs in database
         
         Args:
-            humming_path: Path to humming audio file
+            humming_path: Path to humming audio file, or a file-like object (e.g. BytesIO)
             top_k: Number of top matches to return
             
         Returns:
@@ -435,14 +916,36 @@ class HummingMatcher:
         pitch = self.pitch_extractor.extract_pitch(humming_path)
         contour = self.contour_extractor.extract_contour(pitch)
         
+        return self._match_contour(contour, top_k)
+    
+    def _match_contour(self, contour: np.ndarray, top_k: int = 5) -> List[Tuple[str, float]]:
+        """Match an already extracted humming contour (see match_humming)"""
         if len(contour) == 0:
             raise ValueError("Could not extract valid melody from humming")
         
-        # Compare with all songs
-        results = []
-        for song_id, signature in self.database.signatures.items():
-            distance = self.dtw_matcher.compute_distance(contour, signature.pitch_contour)
-            results.append((song_id, distance))
+        # Compare with all songs (or the coarse candidates), most promising
+        # (lowest LB_Keogh bound) first: the top_k of those set the k-th best
+        # distance, then the rest run in parallel, skipping songs whose bound
+        # is already worse and abandoning DTW for anything that turns out worse
+        # One snapshot for the whole query: a concurrent register/remove_song
+        # repacks, and mixing arrays from two packings misattributes distances
+        packed = self.database.packed()
+        song_ids = packed[2]
+        bounds = self._lower_bounds(contour, packed)
+        if self.coarse_factor is None:
+            order = np.argsort(bounds, kind='stable')
+        else:
+            candidates = self._coarse_candidates(contour, max(top_k, 0) * self.coarse_factor, packed)
+            order = candidates[np.argsort(bounds[candidates], kind='stable')]
+        n_seed = min(max(top_k, 0), len(order))
+        
+        distances = np.full(len(song_ids), np.inf)
+        seed, rest = order[:n_seed], order[n_seed:]
+        distances[seed] = self._match_all(contour, seed, packed=packed)
+        threshold = distances[seed].max() if n_seed > 0 else float('inf')
+        rest = rest[bounds[rest] <= threshold]
+        distances[rest] = self._match_all(contour, rest, threshold, packed)
+        results = [(song_id, float(d)) for song_id, d in zip(song_ids, distances)]
         
         # Sort by distance (ascending)
         results.sort(key=lambda x: x[1])
@@ -450,12 +953,58 @@ class HummingMatcher:
         # Return top k
         return results[:top_k]
     
-    def match_with_details(self, humming_path: str) -> Dict:
+    def _match_all(self, contour: np.ndarray, songs: Optional[np.ndarray] = None,
+                   threshold: float = float('inf'), packed: Optional[tuple] = None) -> np.ndarray:
+        """
+        DTW distances from a query contour to the packed songs at index songs
+        (all songs by default), in the packed snapshot given (default: the current one)
+        
+        Songs whose distance would exceed threshold come back as inf
+        """
+        flat, offsets, _ = packed if packed is not None else self.database.packed()
+        if songs is None:
+            songs = np.arange(len(offsets) - 1)
+        out = np.empty(len(songs))
+        window_size = self.dtw_matcher.window_size
+        with _PARALLEL_LOCK:
+            _dtw_all(np.ascontiguousarray(contour, dtype=np.int8), flat, offsets,
+                     np.asarray(songs, dtype=np.int64), -1 if window_size is None else window_size,
+                     threshold, get_num_threads(), out)
+        return out
+    
+    def _coarse_candidates(self, contour: np.ndarray, n_candidates: int,
+                           packed: Optional[tuple] = None) -> np.ndarray:
+        """
+        Indices of the n_candidates packed songs whose resampled contours
+        differ from the query's in the fewest frames
+        """
+        matrix = self.database.resampled(packed)
+        mismatches = (matrix != _resample_contour(contour, matrix.shape[1])).sum(axis=1)
+        if n_candidates >= len(mismatches):
+            return np.arange(len(mismatches))
+        if n_candidates <= 0:
+            return np.arange(0)
+        return np.sort(np.argpartition(mismatches, n_candidates - 1)[:n_candidates])
+    
+    def _lower_bounds(self, contour: np.ndarray, packed: Optional[tuple] = None) -> np.ndarray:
+        """LB_Keogh lower bounds on the DTW distance from a query contour to every packed song"""
+        if packed is None:
+            packed = self.database.packed()
+        offsets = packed[1]
+        out = np.empty(len(offsets) - 1)
+        window_size = self.dtw_matcher.window_size
+        counts = self.database.value_counts(packed)
+        with _PARALLEL_LOCK:
+            _lb_keogh_all(np.ascontiguousarray(contour, dtype=np.int8), counts,
+                          offsets, -1 if window_size is None else window_size, out)
+        return out
+    
+    def match_with_details(self, humming_path: Union[str, BinaryIO]) -> Dict:
         """
         Match humming and return detailed information
         
         Args:
-            humming_path: Path to humming audio file
+            humming_path: Path to humming audio file, or a file-like object (e.g. BytesIO)
             
         Returns:
             Dictionary with match results and diagnostic info
@@ -464,8 +1013,8 @@ class HummingMatcher:
         pitch = self.pitch_extractor.extract_pitch(humming_path)
         contour = self.contour_extractor.extract_contour(pitch)
         
-        # Get matches
-        matches = self.match_humming(humming_path, top_k=5)
+        # Get matches from the same contour
+        matches = self._match_contour(contour, top_k=5)
         
         return {
             'query': {
@@ -0,0 +1,34 @@
+import pytest
+
+import match
+
+
+def make_play(points, outcome='C'):
+    """Passes along consecutive (x, y) points"""
+    return [
+        {'passer_x': x0, 'passer_y': y0, 'receiver_x': x1, 'receiver_y': y1, 'outcome': outcome}
+        for (x0, y0), (x1, y1) in zip(points, points[1:])
+    ]
+
+
+PLAYS1 = [
+    make_play([(10, 10), (30, 20), (50, 30), (70, 40)]),
+    make_play([(60, 50), (40, 40), (20, 30)]),
+]
+PLAYS2 = [
+    make_play([(12, 12), (31, 22), (52, 29), (71, 41)]),
+    make_play([(80, 10), (90, 20), (95, 34)]),
+    make_play([(58, 52), (41, 38), (22, 33)]),
+]
+
+
+@pytest.mark.parametrize('top_k', [0, -1])
+def test_compare_plays_rejects_top_k_below_one(top_k):
+    with pytest.raises(ValueError):
+        match.compare_plays(PLAYS1, PLAYS2, top_k=top_k)
+
+
+def test_compare_plays_top_k_matches_full_ranking():
+    full = match.compare_plays(PLAYS1, PLAYS2)
+    for top_k in (1, 2, len(full) + 1):
+        assert match.compare_plays(PLAYS1, PLAYS2, top_k=top_k) == full[:top_k]
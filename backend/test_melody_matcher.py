@@ -0,0 +1,94 @@
+import mmap
+import pickle
+
+import numpy as np
+
+from melody_matcher import HummingMatcher, MelodyDatabase, MelodySignature
+
+
+def make_database(n_songs=5, seed=0):
+    rng = np.random.default_rng(seed)
+    database = MelodyDatabase()
+    for i in range(n_songs):
+        contour = rng.integers(-1, 2, 100 + i).astype(np.int8)
+        pitch = rng.uniform(100, 400, 101 + i).astype(np.float32)
+        database.register(f'song{i}', MelodySignature(contour, pitch, f'song{i}', 30.0))
+    return database
+
+
+def is_mapped(array):
+    """Whether array's memory comes from a memory-mapped file"""
+    while array is not None:
+        if isinstance(array, (np.memmap, mmap.mmap)):
+            return True
+        array = getattr(array, 'base', None)
+    return False
+
+
+def test_pack_round_trip(tmp_path):
+    database = make_database()
+    path = tmp_path / 'signatures.pack'
+    database.save(path)
+
+    loaded = MelodyDatabase()
+    loaded.load(path)
+
+    assert loaded.list_songs() == database.list_songs()
+    for song_id in database.list_songs():
+        expected, actual = database.get_signature(song_id), loaded.get_signature(song_id)
+        assert np.array_equal(actual.pitch_contour, expected.pitch_contour)
+        assert np.array_equal(actual.pitch_values, expected.pitch_values)
+        assert actual.duration == expected.duration
+
+    query = database.get_signature('song2').pitch_contour[5:95]
+    assert HummingMatcher(loaded)._match_contour(query, 3) == HummingMatcher(database)._match_contour(query, 3)
+
+
+def test_saving_over_the_loaded_pack_releases_the_mapping(tmp_path):
+    path = tmp_path / 'signatures.pack'
+    make_database().save(path)
+
+    database = MelodyDatabase()
+    database.load(path)
+    assert is_mapped(database.packed()[0])
+    database.remove_song('song0')
+
+    database.save(path)
+
+    assert not is_mapped(database.packed()[0])
+    for signature in database.signatures.values():
+        assert not is_mapped(signature.pitch_contour)
+        assert not is_mapped(signature.pitch_values)
+
+    reloaded = MelodyDatabase()
+    reloaded.load(path)
+    assert reloaded.list_songs() == ['song1', 'song2', 'song3', 'song4']
+
+
+def test_derived_arrays_follow_the_packed_snapshot():
+    database = make_database()
+    snapshot = database.packed()
+    database.register('song5', MelodySignature(np.ones(40, dtype=np.int8), np.ones(41, dtype=np.float32), 'song5', 30.0))
+
+    assert len(database.value_counts(snapshot)) == len(snapshot[0]) + 1
+    assert len(database.resampled(snapshot)) == len(snapshot[2])
+    current = database.packed()
+    assert current is not snapshot
+    assert len(database.value_counts()) == len(current[0]) + 1
+    assert len(database.resampled()) == len(current[2])
+
+
+def test_legacy_pickle_signature_is_migrated_in_place(tmp_path):
+    path = tmp_path / 'song.sig'
+    contour = np.array([1, 0, -1, 1], dtype=np.int8)
+    pitch = np.array([100, 110, 105, 120, 125], dtype=np.float32)
+    with open(path, 'wb') as f:
+        pickle.dump({'pitch_contour': contour, 'pitch_values': pitch, 'duration': 12.0}, f)
+
+    MelodyDatabase().load_signature('song', path)
+
+    assert [p.name for p in tmp_path.iterdir()] == ['song.sig']
+    migrated = MelodyDatabase().load_signature('song', path)
+    assert np.array_equal(migrated.pitch_contour, contour)
+    assert np.array_equal(migrated.pitch_values, pitch)
+    assert migrated.duration == 12.0
@@ -0,0 +1,64 @@
+import io
+import os
+import types
+
+import pytest
+
+import upload_io
+
+
+@pytest.fixture
+def fresh_engines(monkeypatch):
+    """Give each test its own engine state"""
+    monkeypatch.setattr(upload_io, '_engines', upload_io.threading.local())
+    monkeypatch.setattr(upload_io, '_uring_available', upload_io.liburing is not None)
+
+
+def upload(data):
+    return types.SimpleNamespace(stream=io.BytesIO(data))
+
+
+def test_save_upload_through_io_uring(tmp_path, fresh_engines):
+    if upload_io._get_engine() is None:
+        pytest.skip('io_uring not available')
+    data = os.urandom(3 * (1 << 20) + 123)
+    path = tmp_path / 'upload.bin'
+
+    upload_io.save_upload(upload(data), str(path), bufsize=1 << 20)
+
+    assert upload_io._uring_available
+    assert path.read_bytes() == data
+
+
+def test_cython_bindings_get_nbytes(monkeypatch):
+    calls = []
+    fake = types.SimpleNamespace(io_uring_prep_write=lambda *args: calls.append(args))
+    monkeypatch.setattr(upload_io, 'liburing', fake)
+    monkeypatch.setattr(upload_io, '_CYTHON_BINDINGS', True)
+
+    upload_io._prep_write('sqe', 7, b'hello', 64)
+
+    assert calls == [('sqe', 7, b'hello', 5, 64)]
+
+
+def test_engine_error_falls_back_to_buffered_copy(tmp_path, monkeypatch, fresh_engines):
+    class BrokenEngine:
+        def write_stream(self, stream, fd, chunk_size=1 << 20):
+            stream.read(10)
+            raise TypeError('bad binding')
+
+        def close(self):
+            pass
+
+    monkeypatch.setattr(upload_io, '_uring_available', True)
+    monkeypatch.setattr(upload_io, 'IoUringBatchEngine', lambda **kwargs: BrokenEngine())
+    data = b'x' * 100 + b'y' * 100
+    path = tmp_path / 'upload.bin'
+
+    upload_io.save_upload(upload(data), str(path))
+    assert path.read_bytes() == data
+    assert not upload_io._uring_available
+
+    upload_io.write_buffer(str(path), memoryview(b'buffer'))
+    assert path.read_bytes() == b'buffer'
+
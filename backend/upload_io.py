@@ -0,0 +1,201 @@
+"""
+Upload File I/O
+Writes uploaded files to disk through io_uring (Linux + liburing), falling back
+to plain buffered copies everywhere else
+"""
+
+import io
+import os
+import shutil
+import threading
+
+try:
+    import liburing
+except ImportError:  # Non-Linux or liburing not installed
+    liburing = None
+
+# liburing releases up to 2024.x are Cython bindings (io_uring / io_uring_cqe,
+# io_uring_prep_write(sqe, fd, buf, nbytes, offset)); later ones use Ring / Cqe
+# and io_uring_prep_write(sqe, fd, buf, offset), where a fifth argument is
+# silently taken as the offset
+_CYTHON_BINDINGS = liburing is not None and not hasattr(liburing, 'Ring')
+
+
+def _prep_write(sqe, fd: int, buf: bytes, offset: int) -> None:
+    """Prepare a positional write of all of buf with either liburing binding"""
+    if _CYTHON_BINDINGS:
+        liburing.io_uring_prep_write(sqe, fd, buf, len(buf), offset)
+    else:
+        liburing.io_uring_prep_write(sqe, fd, buf, offset)
+
+
+class IoUringBatchEngine:
+    """Batches positional file writes through a single io_uring instance"""
+
+    def __init__(self, entries: int = 64, max_batch: int = 16):
+        """
+        Initialize io_uring engine
+
+        Args:
+            entries: Submission queue size
+            max_batch: Maximum number of writes submitted together
+        """
+        self.max_batch = min(max_batch, entries)
+        if _CYTHON_BINDINGS:
+            self.ring = liburing.io_uring()
+            self.cqe = liburing.io_uring_cqe()
+        else:
+            self.ring = liburing.Ring()
+            self.cqe = liburing.Cqe()
+        liburing.io_uring_queue_init(entries, self.ring)
+
+    def write_stream(self, stream, fd: int, chunk_size: int = 1 << 20) -> int:
+        """
+        Copy a readable stream into an open file descriptor
+
+        Args:
+            stream: File-like object returning bytes from read()
+            fd: Destination file descriptor (opened for writing)
+            chunk_size: Bytes per write request
+
+        Returns:
+            Total number of bytes written
+        """
+        offset = 0
+        while True:
+            batch = []
+            while len(batch) < self.max_batch:
+                chunk = stream.read(chunk_size)
+                if not chunk:
+                    break
+                batch.append((offset, bytes(chunk)))
+                offset += len(chunk)
+
+            if batch:
+                self._submit_batch(fd, batch)
+            if len(batch) < self.max_batch:
+                return offset
+
+    def _submit_batch(self, fd: int, batch) -> None:
+        """Submit one batch of writes and wait for all completions"""
+        for index, (offset, chunk) in enumerate(batch):
+            sqe = liburing.io_uring_get_sqe(self.ring)
+            _prep_write(sqe, fd, chunk, offset)
+            liburing.io_uring_sqe_set_data64(sqe, index)
+        liburing.io_uring_submit(self.ring)
+
+        short_writes = []
+        completed = 0
+        while completed < len(batch):
+            liburing.io_uring_wait_cqe(self.ring, self.cqe)
+            ready = liburing.io_uring_cq_ready(self.ring)
+            for i in range(ready):
+                entry = self.cqe[i]
+                if entry.res < 0:
+                    error = OSError(-entry.res, os.strerror(-entry.res))
+                    liburing.io_uring_cq_advance(self.ring, ready)
+                    self._drain(len(batch) - completed - ready)
+                    raise error
+                offset, chunk = batch[entry.user_data]
+                if entry.res < len(chunk):
+                    short_writes.append((offset + entry.res, chunk[entry.res:]))
+            liburing.io_uring_cq_advance(self.ring, ready)
+            completed += ready
+
+        # Finish partial writes synchronously (rare for regular files)
+        for offset, remainder in short_writes:
+            while remainder:
+                written = os.pwrite(fd, remainder, offset)
+                offset += written
+                remainder = remainder[written:]
+
+    def _drain(self, pending: int) -> None:
+        """Reap outstanding completions so the ring can be reused"""
+        while pending > 0:
+            liburing.io_uring_wait_cqe(self.ring, self.cqe)
+            ready = liburing.io_uring_cq_ready(self.ring)
+            liburing.io_uring_cq_advance(self.ring, ready)
+            pending -= ready
+
+    def close(self) -> None:
+        """Release the ring"""
+        liburing.io_uring_queue_exit(self.ring)
+
+
+# One engine per thread (rings are not thread-safe); created lazily so that
+# forked server workers never share a parent's ring
+_engines = threading.local()
+_uring_available = liburing is not None
+
+
+def _get_engine():
+    """Get this thread's io_uring engine, or None if io_uring is unusable"""
+    global _uring_available
+    if not _uring_available:
+        return None
+
+    engine = getattr(_engines, 'engine', None)
+    if engine is None:
+        try:
+            engine = IoUringBatchEngine(entries=64, max_batch=16)
+        except Exception as e:
+            print(f"⚠️ io_uring unavailable, using buffered writes: {e}")
+            _uring_available = False
+            return None
+        _engines.engine = engine
+    return engine
+
+
+def _uring_write(engine, path, stream, bufsize) -> bool:
+    """
+    Write a stream to a new file through io_uring
+
+    Returns:
+        False if the engine failed (io_uring is then disabled for the process
+        and the caller rewrites the file with buffered I/O)
+    """
+    global _uring_available
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+            engine.write_stream(stream, fd, bufsize)
+        finally:
+            os.close(fd)
+    except Exception as e:
+        print(f"⚠️ io_uring write failed, using buffered writes: {e}")
+        _uring_available = False
+        _engines.engine = None
+        try:
+            engine.close()
+        except Exception:
+            pass
+        return False
+    return True
+
+
+def save_upload(file_storage, path, bufsize=1 << 20):
+    """Stream an uploaded file to disk"""
+    engine = _get_engine()
+
+    if engine is not None:
+        if _uring_write(engine, path, file_storage.stream, bufsize):
+            return
+        file_storage.stream.seek(0)
+
+    with open(path, 'wb') as dst:
+        if hasattr(os, 'posix_fadvise'):
+            os.posix_fadvise(dst.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        shutil.copyfileobj(file_storage.stream, dst, length=bufsize)
+
+
+def write_buffer(path, data):
+    """Write an in-memory buffer (bytes or memoryview) to a new file"""
+    engine = _get_engine()
+
+    if engine is not None and _uring_write(engine, path, io.BytesIO(data), 1 << 20):
+        return
+
+    with open(path, 'wb') as dst:
+        dst.write(data)
+